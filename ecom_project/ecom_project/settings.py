@@ -54,6 +54,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # trigram lookups for product search
     'rest_framework',
     "cloudinary",
     "cloudinary_storage",
@@ -127,12 +128,31 @@ else:
 DEFAULT_FILE_STORAGE = "cloudinary_storage.storage.MediaCloudinaryStorage"
 
 
-CACHES = {
-    "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-        "LOCATION": "unique-snowflake",
+REDIS_URL = os.environ.get("REDIS_URL")
+
+if REDIS_URL:
+    # In production: one Redis shared by every worker (L2 of products/cache.py)
+    CACHES = {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": REDIS_URL,
+            "OPTIONS": {
+                "CLIENT_CLASS": "django_redis.client.DefaultClient",
+                # A Redis outage turns cache reads into misses instead of
+                # errors; products/cache.py treats missing versions and
+                # failed locks as misses and computes the response itself
+                "IGNORE_EXCEPTIONS": True,
+            },
+        }
+    }
+else:
+    # Local dev: per-process memory cache
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "unique-snowflake",
+        }
     }
-}
 
 
 # Password validation
@@ -201,6 +221,15 @@ STATICFILES_STORAGE = (
 
 PHONENUMBER_DEFAULT_REGION = "DZ"
 
+# How long (seconds) a pending order holds its stock; see orders/reservations.py
+STOCK_RESERVATION_TTL = int(os.getenv("STOCK_RESERVATION_TTL", 72 * 60 * 60))
+
+# How long (seconds) an order's Idempotency-Key replays its response; see orders/idempotency.py
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", 24 * 60 * 60))
+# After how long (seconds) a retry may take over a key whose request never
+# finished; keep it well above the worker / proxy request timeout.
+IDEMPOTENCY_STALE_AFTER = int(os.getenv("IDEMPOTENCY_STALE_AFTER", 10 * 60))
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
@@ -0,0 +1,141 @@
+"""
+Batch order acceptance / rejection.
+
+accept_orders() handles any number of Pending orders in a fixed number of
+queries:
+
+1. lock the selected Pending orders, read their items and reservations;
+2. lock every variant they use, once (products.stock.lock_variants);
+3. allocate stock to the orders in order_date order, in Python. An order
+   is accepted only if all of its items fit in the free stock left plus
+   what it holds itself (orders/reservations.py);
+4. write all stock, reserved and sold changes
+   (products.stock.apply_decrements), delete the consumed reservations,
+   write all statuses (one bulk_update) and re-total the accepted orders
+   from their stored item prices (one UPDATE, Order.objects.retotal).
+
+Each order gets an OrderResult that the admin action shows.
+"""
+from collections import defaultdict, namedtuple
+
+from django.db import transaction
+
+from products.stock import apply_decrements, lock_variants, merge_lines, shortage
+
+from .models import Order, OrderItem, StockReservation
+from .reservations import held_by_orders, release_reservations
+
+ACCEPTED, REJECTED, PENDING = "Accepted", "Rejected", "Pending"
+
+
+class OrderResult(namedtuple("OrderResult", "order_id ok errors")):
+    """errors: messages explaining why the order was not processed."""
+
+    def __str__(self):
+        return f"Order #{self.order_id}: {'; '.join(self.errors)}"
+
+
+def _selected_ids(orders):
+    # admin changelist querysets come with prefetches and annotations
+    return list(orders.order_by().prefetch_related(None).values_list("pk", flat=True))
+
+
+def _lock_pending(order_ids):
+    return list(
+        Order.objects
+        .select_for_update()
+        .filter(pk__in=order_ids, order_status=PENDING)
+        .only("id", "order_date", "delivery_fees", "order_status", "total_amount")
+        .order_by("order_date", "id")
+    )
+
+
+def _not_pending_results(order_ids, processed):
+    processed = set(processed)
+    return [
+        OrderResult(pk, False, ["Only pending orders can be changed."])
+        for pk in order_ids if pk not in processed
+    ]
+
+
+def allocate_stock(orders):
+    """
+    Allocation core, shared with Order.save(). `orders` are Pending Order
+    instances locked by the caller, in the order they should be served.
+    Writes the stock / sold changes and converts the orders' reservations,
+    sets order_status on the accepted instances (the caller saves them and
+    re-totals them) and returns one OrderResult per order.
+    """
+    order_ids = [order.pk for order in orders]
+    lines = defaultdict(list)
+    for order_id, variant_id, quantity in (
+        OrderItem.objects
+        .filter(order_id__in=order_ids)
+        .values_list("order_id", "product_variant_id", "quantity")
+    ):
+        lines[order_id].append((variant_id, quantity))
+    held = held_by_orders(order_ids)
+
+    rows = lock_variants({variant_id for order_lines in lines.values() for variant_id, _ in order_lines})
+    remaining = {variant_id: dict(row) for variant_id, row in rows.items()}
+
+    results, applied, released, accepted = [], defaultdict(int), defaultdict(int), []
+    for order in orders:
+        requested = merge_lines(lines[order.pk])
+        own = {variant_id: min(held[order.pk].get(variant_id, 0), quantity) for variant_id, quantity in requested.items()}
+        shortages = [
+            s for s in (
+                shortage(variant_id, quantity, remaining.get(variant_id), own[variant_id])
+                for variant_id, quantity in requested.items()
+            ) if s
+        ]
+        if shortages:
+            results.append(OrderResult(order.pk, False, [str(s) for s in shortages]))
+            continue
+        for variant_id, quantity in requested.items():
+            remaining[variant_id]["stock"] -= quantity
+            remaining[variant_id]["reserved"] -= own[variant_id]
+            applied[variant_id] += quantity
+            released[variant_id] += own[variant_id]
+        order.order_status = ACCEPTED
+        accepted.append(order.pk)
+        results.append(OrderResult(order.pk, True, []))
+
+    if applied:
+        apply_decrements(dict(applied), rows, released={pk: n for pk, n in released.items() if n})
+    if accepted:
+        # the held units were just consumed above
+        StockReservation.objects.filter(order_id__in=accepted).delete()
+    return results
+
+
+def accept_orders(orders):
+    """
+    Accepts the Pending orders in the `orders` queryset, oldest first, as
+    far as stock allows. Returns a list of OrderResult, one per order in
+    the queryset (non-pending orders are reported as skipped).
+    """
+    order_ids = _selected_ids(orders)
+    with transaction.atomic():
+        pending = _lock_pending(order_ids)
+        results = allocate_stock(pending)
+        accepted = [order for order in pending if order.order_status == ACCEPTED]
+        if accepted:
+            Order.objects.bulk_update(accepted, ["order_status"])
+            # from the prices stored on the lines at checkout
+            Order.objects.retotal([order.pk for order in accepted])
+
+    return results + _not_pending_results(order_ids, [order.pk for order in pending])
+
+
+def reject_orders(orders):
+    """
+    Rejects the Pending orders in the `orders` queryset and releases their
+    reservations. Returns a list of OrderResult.
+    """
+    order_ids = _selected_ids(orders)
+    with transaction.atomic():
+        pending = [order.pk for order in _lock_pending(order_ids)]
+        Order.objects.filter(pk__in=pending).update(order_status=REJECTED)
+        release_reservations(pending)
+    return [OrderResult(pk, True, []) for pk in pending] + _not_pending_results(order_ids, pending)
@@ -1,9 +1,12 @@
+import phonenumbers
 from django.contrib import admin, messages
-from django.core.exceptions import ValidationError
-from django.db.models import Case, When, Value, IntegerField, Prefetch
+from django.db.models import Prefetch
 from django.utils.html import format_html
 
+from .acceptance import accept_orders, reject_orders
 from .models import Order, OrderItem
+from .pagination import EstimatedCountPaginator
+from products.admin import VariantAutocompleteSelect, variant_label
 from products.models import ProductVariant
 
 
@@ -20,6 +23,19 @@ class OrderItemInline(admin.StackedInline):
     )
     readonly_fields = ('price', 'get_product_name', 'get_product_size', 'get_product_color')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product_variant__product')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'product_variant':
+            # searched on demand instead of a <select> of every variant
+            kwargs['widget'] = VariantAutocompleteSelect(db_field, self.admin_site)
+            kwargs['queryset'] = ProductVariant.objects.select_related('product')
+            field = super().formfield_for_foreignkey(db_field, request, **kwargs)
+            field.label_from_instance = variant_label
+            return field
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
     def get_product_name(self, item_obj):
         return item_obj.product_variant.product.name if item_obj.product_variant else "-"
     get_product_name.short_description = 'Product'
@@ -39,49 +55,28 @@ class OrderItemInline(admin.StackedInline):
         return obj is None
 
 
-@admin.action(description="Mark selected orders as Accepted")
-def mark_as_accepted(modeladmin, request, queryset):
-    pending_qs = queryset.filter(order_status__iexact="Pending")
-    accepted_count = 0
-    error_messages = []
-
-    for order in pending_qs:
-        order.order_status = "Accepted"
-        try:
-            order.full_clean()
-            order.save()
-            order.update_total()
-            accepted_count += 1
-        except ValidationError as e:
-            msg = e.error_dict.get("order_status") or e.messages
-            if isinstance(msg, list):
-                msg = "; ".join(str(m) for m in msg)
-            elif hasattr(msg, "__iter__") and "order_status" in e.error_dict:
-                msg = e.error_dict["order_status"][0]
-            error_messages.append(f"Order #{order.pk}: {msg}")
-
-    if accepted_count:
+def _report(modeladmin, request, results, verb):
+    done = sum(1 for result in results if result.ok)
+    if done:
         modeladmin.message_user(
             request,
-            f"{accepted_count} order(s) marked as Accepted.",
+            f"{done} order(s) marked as {verb}.",
             level=messages.SUCCESS
         )
-    for err in error_messages:
-        modeladmin.message_user(request, err, level=messages.ERROR)
+    for result in results:
+        if not result.ok:
+            modeladmin.message_user(request, str(result), level=messages.ERROR)
+
+
+@admin.action(description="Mark selected orders as Accepted")
+def mark_as_accepted(modeladmin, request, queryset):
+    # Oldest orders get the stock first; see orders/acceptance.py
+    _report(modeladmin, request, accept_orders(queryset), "Accepted")
 
 
 @admin.action(description="Mark selected orders as Rejected")
 def mark_as_rejected(modeladmin, request, queryset):
-    pending_qs = queryset.filter(order_status__iexact='Pending')
-    rejected_count = 0
-    for order in pending_qs:
-        order.order_status = 'Rejected'
-        order.save()
-        rejected_count += 1
-    modeladmin.message_user(
-        request,
-        f"{rejected_count} order(s) marked as rejected."
-    )
+    _report(modeladmin, request, reject_orders(queryset), "Rejected")
 
 
 @admin.register(Order)
@@ -95,25 +90,59 @@ class OrderAdmin(admin.ModelAdmin):
         'total_amount_formatted',
     )
     list_display_links = ('id', 'costumer_name')
-    list_filter = ('order_status',)
+    # a plain date filter instead of date_hierarchy, which aggregates the
+    # whole table on every load
+    list_filter = ('order_status', 'order_date')
     search_fields = ('costumer_name', 'costumer_phone')
-    date_hierarchy = 'order_date'
+    search_help_text = "Order number, phone number (full or first digits) or start of the customer name."
     actions = [mark_as_accepted, mark_as_rejected]
     inlines = [OrderItemInline]
+    # Pending first, newest first: served by order_status_rank_date_idx
+    ordering = ('status_rank', '-order_date', '-id')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_ordering(self, request):
+        if request.GET.get('order_status__exact'):
+            # one status: the rank is constant, and the Pending queue is
+            # read straight off order_pending_date_idx
+            return ('-order_date', '-id')
+        return super().get_ordering(request)
 
     def get_queryset(self, request):
-        qs = super().get_queryset(request).annotate(
-            _status_order=Case(
-                When(order_status__iexact='pending', then=Value(0)),
-                When(order_status__iexact='accepted', then=Value(1)),
-                default=Value(2),
-                output_field=IntegerField(),
-            )
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('product_variant__product'))
         )
 
-        return qs.prefetch_related(
-            Prefetch('items', queryset=OrderItem.objects.select_related('product_variant__product'))
-        ).order_by('_status_order', '-order_date')
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Index-friendly search: an order number, a phone number matched
+        exactly (any national/international spelling) or on its leading
+        digits, or a customer name prefix. No leading-wildcard LIKEs.
+        """
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        digits = ''.join(c for c in term if c.isdigit())
+        if digits and not term.strip('+0123456789 -.()'):
+            try:
+                number = phonenumbers.parse(term, 'DZ')
+            except phonenumbers.NumberParseException:
+                number = None
+            if number is not None and phonenumbers.is_valid_number(number):
+                e164 = phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
+                matches = queryset.filter(costumer_phone=e164)
+            else:
+                # leading digits of a national number (0555...) or with the country code
+                national = digits[1:] if digits.startswith('0') else digits
+                prefix = f"+{digits}" if term.startswith('+') or digits.startswith('213') else f"+213{national}"
+                matches = queryset.filter(costumer_phone__startswith=prefix)
+            if len(digits) <= 9:
+                matches = matches | queryset.filter(pk=int(digits))
+            return matches, False
+        # UPPER(costumer_name) LIKE UPPER('x%'): served by
+        # order_costumer_name_upper_like on PostgreSQL (migration 0010)
+        return queryset.filter(costumer_name__istartswith=term), False
 
     def get_readonly_fields(self, request, obj=None):
         if obj:
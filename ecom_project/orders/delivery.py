@@ -0,0 +1,138 @@
+"""
+Delivery fees, computed server-side from the Wilaya / Commune tables.
+
+The 58 wilayas and their communes are small and rarely change, so every
+process keeps them as a precomputed lookup table and quote() answers
+from memory, without touching the database. The table is built on first
+use and rebuilt when the "delivery" cache namespace version changes:
+saving or deleting a Wilaya / Commune bumps it (orders/signals.py), and
+the other workers notice within CHECK_INTERVAL. The same load renders
+the wilaya -> communes tree served by /api/orders/wilayas.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+
+from products.cache import get_versions, invalidate
+
+DELIVERY = "delivery"
+DOMICILE, BUREAU = "A Domicile", "Bureau"
+DELIVERY_TYPES = ((DOMICILE, DOMICILE), (BUREAU, BUREAU))
+CHECK_INTERVAL = 30  # seconds between two reads of the namespace version
+
+WilayaFees = namedtuple("WilayaFees", "name domicile_price bureau_price communes")
+DeliveryQuote = namedtuple("DeliveryQuote", "wilaya commune delivery_type delivery_fees")
+
+
+class UnknownDestination(ValueError):
+    """`field` is the request field the message belongs to."""
+
+    def __init__(self, field, message):
+        super().__init__(message)
+        self.field = field
+
+
+def _normalize(name):
+    return " ".join(str(name).split()).casefold()
+
+
+class DeliveryTable:
+    """
+    Process-wide wilaya -> fees / communes lookup, keyed on normalized
+    names, and the whole tree as a ready-to-send JSON body.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def _load(self):
+        from .models import Commune, Wilaya
+
+        wilayas = {
+            pk: WilayaFees(name, domicile_price, bureau_price, {})
+            for pk, name, domicile_price, bureau_price in
+            Wilaya.objects.order_by("name").values_list("pk", "name", "domicile_price", "bureau_price")
+        }
+        for wilaya_id, name in Commune.objects.order_by("name").values_list("wilaya_id", "name"):
+            wilayas[wilaya_id].communes[_normalize(name)] = name
+
+        tree = [
+            {
+                "name": fees.name,
+                "domicile_price": str(fees.domicile_price),
+                "bureau_price": str(fees.bureau_price),
+                "communes": list(fees.communes.values()),
+            }
+            for fees in wilayas.values()
+        ]
+        body = json.dumps(tree, ensure_ascii=False, separators=(",", ":")).encode()
+        lookup = {_normalize(fees.name): fees for fees in wilayas.values()}
+        return lookup, body, hashlib.md5(body).hexdigest()
+
+    def snapshot(self):
+        """(lookup, body, etag), reloaded when the namespace version moved."""
+        now = time.monotonic()
+        if self._snapshot is not None and now - self._checked_at < CHECK_INTERVAL:
+            return self._snapshot
+        with self._lock:
+            if self._snapshot is None or now - self._checked_at >= CHECK_INTERVAL:
+                # read the version first: a change committed while loading
+                # leaves a newer version behind and triggers another load
+                version, = get_versions([DELIVERY])
+                if self._snapshot is None or version != self._version:
+                    self._snapshot = self._load()
+                    self._version = version
+                self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def wilayas(self):
+        return self.snapshot()[0]
+
+    def tree(self):
+        """The JSON body of /api/orders/wilayas and its ETag."""
+        _, body, etag = self.snapshot()
+        return body, etag
+
+    def reset(self):
+        with self._lock:
+            self._snapshot = None
+
+
+table = DeliveryTable()
+
+
+def delivery_changed():
+    """Rebuilds the table here and, through the namespace version, in every other process."""
+    from django.db import transaction
+
+    invalidate([DELIVERY])
+    # now for this transaction's own reads, and again once the change is
+    # visible to everyone in case a concurrent request reloaded it meanwhile
+    table.reset()
+    transaction.on_commit(table.reset)
+
+
+def quote(wilaya, commune=None, delivery_type=BUREAU):
+    """
+    Returns a DeliveryQuote with the canonical wilaya / commune names and
+    the fees. Raises UnknownDestination for an unknown wilaya, or a
+    commune that is not in it. No database queries once the table is
+    loaded.
+    """
+    fees = table.wilayas().get(_normalize(wilaya or ""))
+    if fees is None:
+        raise UnknownDestination("wilaya", f"Unknown wilaya “{wilaya}”.")
+    if commune:
+        name = fees.communes.get(_normalize(commune))
+        if name is None:
+            raise UnknownDestination("commune", f"“{commune}” is not a commune of {fees.name}.")
+        commune = name
+    else:
+        commune = None
+    price = fees.domicile_price if delivery_type == DOMICILE else fees.bureau_price
+    return DeliveryQuote(fees.name, commune, delivery_type, price)
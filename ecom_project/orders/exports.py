@@ -0,0 +1,94 @@
+"""
+Streaming order exports, built on the helpers in products.exports.
+"""
+from datetime import datetime, time
+
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from products.exports import CHUNK_SIZE, stream_csv, stream_ndjson
+
+from .models import Order, OrderItem
+
+ORDER_CSV_HEADER = [
+    "order_id", "order_date", "order_status", "costumer_name", "costumer_phone",
+    "wilaya", "commune", "delivery_type", "delivery_fees", "total_amount",
+    "product_id", "product", "color", "size", "quantity", "price",
+]
+
+
+def export_orders_queryset(status=None, since=None):
+    """`since` is a date: orders placed from its midnight, in the current time zone."""
+    items = (
+        OrderItem.objects
+        .select_related("product_variant__product")
+        .only(
+            "id", "order_id", "quantity", "price",
+            "product_variant__size",
+            "product_variant__product__id",
+            "product_variant__product__name",
+            "product_variant__product__color",
+        )
+        .order_by("id")
+    )
+    queryset = Order.objects.prefetch_related(Prefetch("items", queryset=items)).order_by("id")
+    if status:
+        queryset = queryset.filter(order_status=status)
+    if since:
+        # an aware bound rather than order_date__date, so order_date's index still applies
+        queryset = queryset.filter(order_date__gte=timezone.make_aware(datetime.combine(since, time.min)))
+    return queryset
+
+
+def _order_fields(order):
+    return {
+        "order_id": order.id,
+        "order_date": order.order_date,
+        "order_status": order.order_status,
+        "costumer_name": order.costumer_name,
+        "costumer_phone": str(order.costumer_phone),
+        "wilaya": order.wilaya,
+        "commune": order.commune,
+        "delivery_type": order.delivery_type,
+        "delivery_fees": order.delivery_fees,
+        "total_amount": order.total_amount,
+    }
+
+
+def _item_fields(item):
+    variant = item.product_variant
+    product = variant.product if variant else None
+    return {
+        "product_id": product.id if product else None,
+        "product": product.name if product else None,
+        "color": product.color if product else None,
+        "size": variant.size if variant else None,
+        "quantity": item.quantity,
+        "price": item.price,
+    }
+
+
+def order_csv_rows(queryset, chunk_size=CHUNK_SIZE):
+    """One row per order item; orders without items get one row with no product."""
+    for order in queryset.iterator(chunk_size=chunk_size):
+        base = list(_order_fields(order).values())
+        items = order.items.all()
+        for item in items:
+            yield base + list(_item_fields(item).values())
+        if not items:
+            yield base + [None] * 6
+
+
+def order_objects(queryset, chunk_size=CHUNK_SIZE):
+    for order in queryset.iterator(chunk_size=chunk_size):
+        obj = _order_fields(order)
+        obj["items"] = [_item_fields(item) for item in order.items.all()]
+        yield obj
+
+
+def export_orders(fmt, queryset=None, chunk_size=CHUNK_SIZE):
+    """Yields the text of an order export in `fmt` ("csv" or "ndjson")."""
+    queryset = export_orders_queryset() if queryset is None else queryset
+    if fmt == "csv":
+        return stream_csv(ORDER_CSV_HEADER, order_csv_rows(queryset, chunk_size))
+    return stream_ndjson(order_objects(queryset, chunk_size))
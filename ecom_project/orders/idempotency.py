@@ -0,0 +1,205 @@
+"""
+Idempotency-Key support for POST endpoints.
+
+The first request with a given key inserts an in-progress IdempotencyKey
+row (committed on its own, so concurrent duplicates see it), then runs
+the view in a transaction and stores the response in the same
+transaction as the view's own writes. Then:
+
+- a retry with the same key and body replays the stored (2xx) response,
+  with one indexed lookup and no access to the order tables;
+- a duplicate that arrives while the first is still running waits for it
+  (up to WAIT_TIMEOUT) and then replays its response;
+- the same key with a different body gets 422;
+- if the view fails (exception or non-2xx response), its writes are
+  rolled back and the key is dropped, so a retry runs it again;
+- a key whose request is still unfinished after
+  settings.IDEMPOTENCY_STALE_AFTER is presumed dead and can be taken over
+  by a retry. If the original request does finish after that, it no
+  longer owns the key and its writes are rolled back, so only one of the
+  two goes through.
+
+Keys expire after settings.IDEMPOTENCY_KEY_TTL; `manage.py
+purge_idempotency_keys` deletes expired rows.
+"""
+import hashlib
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+HEADER = "HTTP_IDEMPOTENCY_KEY"
+DEFAULT_TTL = 24 * 60 * 60   # seconds
+WAIT_TIMEOUT = 10            # seconds a duplicate waits for the in-flight request
+POLL_INTERVAL = 0.1
+# Headers stored with the response and replayed; e.g. /queue's Location
+# points at the ticket to poll.
+REPLAYED_HEADERS = ("Location",)
+DEFAULT_STALE_AFTER = 10 * 60  # seconds after which an in-progress key is presumed abandoned
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, "IDEMPOTENCY_KEY_TTL", DEFAULT_TTL))
+
+
+def _stale_after():
+    return timedelta(seconds=getattr(settings, "IDEMPOTENCY_STALE_AFTER", DEFAULT_STALE_AFTER))
+
+
+def _error(status, detail, **headers):
+    response = JsonResponse({"detail": detail}, status=status)
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+def _replay(record):
+    response = HttpResponse(
+        bytes(record.response_body),
+        status=record.response_status,
+        content_type=record.response_content_type,
+    )
+    for header, value in (record.response_headers or {}).items():
+        response[header] = value
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _claim(scope, key, fingerprint):
+    """
+    Inserts the in-progress row. Returns (owned, row): owned is True when
+    this request now owns the key, otherwise row is the other request's.
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            return True, IdempotencyKey.objects.create(
+                scope=scope, key=key, fingerprint=fingerprint,
+                started_at=now, expires_at=now + _ttl(),
+            )
+    except IntegrityError:
+        pass
+
+    existing = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+    if existing is None:
+        # deleted in between (failed request or purge): try again
+        return _claim(scope, key, fingerprint)
+    if existing.expires_at <= now or (
+        existing.status == IdempotencyKey.IN_PROGRESS
+        and existing.started_at <= now - _stale_after()
+    ):
+        # Expired, or its request died without cleaning up: take it over,
+        # unless someone else just did.
+        taken = _owned(existing).update(
+            fingerprint=fingerprint, status=IdempotencyKey.IN_PROGRESS, started_at=now,
+            expires_at=now + _ttl(), response_status=None, response_content_type="", response_body=None,
+            response_headers={},
+        )
+        if taken:
+            existing.started_at = now
+            return True, existing
+        existing.refresh_from_db()
+    return False, existing
+
+
+def _owned(record):
+    # started_at doubles as an ownership token: a takeover changes it
+    return IdempotencyKey.objects.filter(pk=record.pk, started_at=record.started_at)
+
+
+def _wait_for(record):
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while record.status == IdempotencyKey.IN_PROGRESS and time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+        if record is None:
+            return None
+    return record
+
+
+def _in_progress():
+    return _error(409, "A request with this Idempotency-Key is still in progress.", **{"Retry-After": "1"})
+
+
+def idempotent(scope):
+    """
+    View decorator: honours an Idempotency-Key header on POST requests.
+    Requests without the header are handled as before.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            key = request.META.get(HEADER)
+            if request.method != "POST" or key is None:
+                return view_func(request, *args, **kwargs)
+            key = key.strip()
+            if not key or len(key) > 255:
+                return _error(400, "Idempotency-Key must be 1 to 255 characters.")
+
+            fingerprint = hashlib.sha256(request.body).hexdigest()
+            owned, record = _claim(scope, key, fingerprint)
+            if not owned:
+                if record.fingerprint != fingerprint:
+                    return _error(422, "This Idempotency-Key was used with a different request body.")
+                record = _wait_for(record)
+                if record is None:
+                    # the original request failed and gave the key up: run this one
+                    owned, record = _claim(scope, key, fingerprint)
+                    if not owned:
+                        return _in_progress()
+                elif record.status == IdempotencyKey.COMPLETED:
+                    return _replay(record)
+                else:
+                    return _in_progress()
+
+            try:
+                with transaction.atomic():
+                    response = view_func(request, *args, **kwargs)
+                    if hasattr(response, "render") and callable(response.render):
+                        response.render()
+                    if not 200 <= response.status_code < 300 or response.streaming:
+                        raise _NotStored(response)
+                    stored = _owned(record).update(
+                        status=IdempotencyKey.COMPLETED,
+                        response_status=response.status_code,
+                        response_content_type=response.get("Content-Type", ""),
+                        response_body=response.content,
+                        response_headers={
+                            header: response[header] for header in REPLAYED_HEADERS if response.has_header(header)
+                        },
+                    )
+                    if not stored:
+                        # a retry took the key over meanwhile: it owns the outcome
+                        raise _Superseded()
+                return response
+            except _Superseded:
+                return _in_progress()
+            except _NotStored as e:
+                _owned(record).delete()
+                return e.response
+            except BaseException:
+                _owned(record).delete()
+                raise
+        return _wrapped_view
+    return decorator
+
+
+class _Superseded(Exception):
+    pass
+
+
+class _NotStored(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+def purge_expired(now=None):
+    """Deletes expired keys. Returns how many were deleted."""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
@@ -0,0 +1,147 @@
+"""
+Asynchronous order ingestion through a database-backed queue.
+
+POST /api/orders/queue validates the order like /create does, appends it
+to the OrderTicket table (one INSERT) and answers 202 with a ticket.
+`manage.py process_order_queue` drains the table in batches. For each
+batch, in one transaction, it:
+
+1. claims the oldest queued tickets (SELECT ... FOR UPDATE SKIP LOCKED
+   on PostgreSQL, so several workers can run side by side);
+2. locks every variant the batch needs once and reserves stock ticket by
+   ticket, in arrival order (orders/reservations.py);
+3. bulk-creates the orders, their items and their reservations, with
+   totals computed from Product.effective_price;
+4. marks the tickets done (with their order) or failed (with the reason).
+
+GET /api/orders/tickets/<ticket> reports the outcome. Only the database is
+needed; there is no broker.
+"""
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from products.stock import apply_reservations, lock_variants, merge_lines, shortage
+
+from .models import Order, OrderItem, OrderTicket, StockReservation
+from .reservations import reservation_ttl
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+ORDER_FIELDS = ("costumer_name", "costumer_phone", "delivery_type", "delivery_fees", "wilaya", "commune")
+
+
+def enqueue(validated_data):
+    """Stores OrderSerializer.validated_data as a queued ticket."""
+    payload = {
+        field: str(validated_data[field]) if validated_data.get(field) is not None else None
+        for field in ORDER_FIELDS if field in validated_data
+    }
+    payload["items"] = [
+        [item["product_variant"].pk, item["quantity"]] for item in validated_data["items"]
+    ]
+    return OrderTicket.objects.create(payload=payload)
+
+
+def _order_from(payload):
+    fields = {field: payload[field] for field in ORDER_FIELDS if payload.get(field) is not None}
+    if "delivery_fees" in fields:
+        fields["delivery_fees"] = Decimal(fields["delivery_fees"])
+    return Order(**fields)
+
+
+def _ingest(tickets):
+    """Creates the orders for `tickets` and records the outcome on each ticket."""
+    requested = {ticket.pk: merge_lines(ticket.payload["items"]) for ticket in tickets}
+    rows = lock_variants({variant_id for lines in requested.values() for variant_id in lines})
+    remaining = {variant_id: dict(row) for variant_id, row in rows.items()}
+
+    reserved, accepted, outcome = defaultdict(int), [], {}
+    for ticket in tickets:
+        lines = requested[ticket.pk]
+        shortages = [
+            s for s in (
+                shortage(variant_id, quantity, remaining.get(variant_id))
+                for variant_id, quantity in lines.items()
+            ) if s
+        ] if lines else ["An order needs at least one item."]
+        if shortages:
+            outcome[ticket.pk] = (OrderTicket.FAILED, None, [str(s) for s in shortages])
+            continue
+        for variant_id, quantity in lines.items():
+            remaining[variant_id]["reserved"] += quantity
+            reserved[variant_id] += quantity
+        accepted.append(ticket)
+
+    if reserved:
+        apply_reservations(dict(reserved))
+
+    orders, items = [], []
+    for ticket in accepted:
+        order = _order_from(ticket.payload)
+        order_items = [
+            OrderItem(
+                product_variant_id=variant_id,
+                quantity=quantity,
+                price=rows[variant_id]["product__effective_price"] * quantity,
+            )
+            for variant_id, quantity in ticket.payload["items"]
+        ]
+        order.total_amount = sum((item.price for item in order_items), order.delivery_fees or 0)
+        orders.append(order)
+        items.append(order_items)
+    Order.objects.bulk_create(orders)
+
+    expires_at = timezone.now() + reservation_ttl()
+    for ticket, order, order_items in zip(accepted, orders, items):
+        for item in order_items:
+            item.order = order
+        outcome[ticket.pk] = (OrderTicket.DONE, order, None)
+    OrderItem.objects.bulk_create([item for order_items in items for item in order_items])
+    StockReservation.objects.bulk_create([
+        StockReservation(order=order, product_variant_id=variant_id, quantity=quantity, expires_at=expires_at)
+        for ticket, order in zip(accepted, orders)
+        for variant_id, quantity in requested[ticket.pk].items()
+    ])
+
+    now = timezone.now()
+    for ticket in tickets:
+        ticket.status, ticket.order, ticket.errors = outcome[ticket.pk]
+        ticket.processed_at = now
+    OrderTicket.objects.bulk_update(tickets, ["status", "order", "errors", "processed_at"])
+
+
+def process_batch(batch_size=BATCH_SIZE):
+    """
+    Turns up to `batch_size` queued tickets into orders. Returns the
+    number of tickets processed (0 when the queue is empty).
+    """
+    with transaction.atomic():
+        tickets = list(
+            OrderTicket.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=OrderTicket.QUEUED)
+            .order_by("id")[:batch_size]
+        )
+        if not tickets:
+            return 0
+        try:
+            with transaction.atomic():
+                _ingest(tickets)
+        except Exception:
+            # Find the ticket that breaks the batch; the others still go through.
+            logger.exception("Order batch failed, retrying its %d tickets one by one", len(tickets))
+            for ticket in tickets:
+                try:
+                    with transaction.atomic():
+                        _ingest([ticket])
+                except Exception as e:
+                    logger.exception("Order ticket %s failed", ticket.ticket)
+                    ticket.status, ticket.order, ticket.errors = OrderTicket.FAILED, None, [str(e)]
+                    ticket.processed_at = timezone.now()
+                    ticket.save(update_fields=["status", "order", "errors", "processed_at"])
+    return len(tickets)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from orders.exports import export_orders, export_orders_queryset
+from orders.models import CHOICES
+from products.exports import CHUNK_SIZE, EXPORT_FORMATS, write_export
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams orders with their items as CSV (one row per item) or NDJSON. "
+        "e.g. the daily delivery sheet: export_orders --status Pending -o pending.csv"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+        parser.add_argument("--status", choices=[value for value, _ in CHOICES])
+        parser.add_argument("--since", help="Only orders placed on or after this date (YYYY-MM-DD)")
+        parser.add_argument("-o", "--output", help="File to write; defaults to stdout")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            try:
+                since = parse_date(options["since"])
+            except ValueError:  # well formed but not a date, e.g. 2024-02-30
+                pass
+            if since is None:
+                raise CommandError("--since must be YYYY-MM-DD")
+        queryset = export_orders_queryset(status=options["status"], since=since)
+        chunks = export_orders(options["format"], queryset, chunk_size=options["chunk_size"])
+        self.stdout.ending = ""  # chunks aren't lines
+        write_export(chunks, options["output"], self.stdout)
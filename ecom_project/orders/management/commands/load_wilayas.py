@@ -0,0 +1,118 @@
+import csv
+import json
+import sys
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from orders.delivery import delivery_changed
+from orders.models import Commune, Wilaya
+
+PRICE_FIELDS = ("domicile_price", "bureau_price")
+
+
+def _read_csv(stream):
+    """One row per commune: wilaya, commune[, domicile_price, bureau_price]."""
+    wilayas = {}
+    for row in csv.DictReader(stream):
+        wilaya = wilayas.setdefault(row["wilaya"].strip(), {"communes": []})
+        for field in PRICE_FIELDS:
+            if row.get(field):
+                wilaya[field] = row[field]
+        if row.get("commune", "").strip():
+            wilaya["communes"].append(row["commune"])
+    return [{"name": name, **data} for name, data in wilayas.items()]
+
+
+def _read_json(stream):
+    """[{"name", "communes": [...], "domicile_price"?, "bureau_price"?}, ...]"""
+    return json.load(stream)
+
+
+def _price(value, wilaya, field):
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        raise CommandError(f"{wilaya}: {field} {value!r} is not a number")
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads the wilayas and their communes from a file in one transaction. "
+        "No dataset ships with the project: export the official list (about 58 "
+        "wilayas and 1,541 communes) from the administration's publication or "
+        "your carrier, and pass it here. Existing rows are matched on name; "
+        "prices are only changed when the file has them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="JSON or CSV file, or - for stdin")
+        parser.add_argument("--format", choices=["json", "csv"], help="Defaults to the file extension")
+        parser.add_argument(
+            "--prune", action="store_true",
+            help="Delete the communes of the loaded wilayas that are not in the file",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("csv" if path.endswith(".csv") else "json")
+        reader = _read_csv if fmt == "csv" else _read_json
+
+        stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        try:
+            data = reader(stream)
+        except (ValueError, KeyError, csv.Error) as e:
+            raise CommandError(f"Could not parse {path}: {e}")
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        with transaction.atomic():
+            counts = self.load(data, options["prune"])
+            # bulk writes skip the signals that refresh the delivery table
+            delivery_changed()
+
+        self.stdout.write(self.style.SUCCESS(
+            "{wilayas} wilaya(s), {created} new commune(s), {deleted} commune(s) removed.".format(**counts)
+        ))
+
+    def load(self, data, prune):
+        wilayas, communes = {}, {}
+        for entry in data:
+            name = " ".join(str(entry.get("name", "")).split())
+            if not name:
+                raise CommandError(f"Wilaya without a name: {entry!r}")
+            wilayas[name] = {
+                field: _price(entry[field], name, field)
+                for field in PRICE_FIELDS if entry.get(field) not in (None, "")
+            }
+            communes[name] = {" ".join(str(c).split()) for c in entry.get("communes", [])} - {""}
+
+        existing = {w.name: w for w in Wilaya.objects.filter(name__in=wilayas)}
+        Wilaya.objects.bulk_create([
+            Wilaya(name=name, **prices) for name, prices in wilayas.items() if name not in existing
+        ])
+        changed = []
+        for name, prices in wilayas.items():
+            wilaya = existing.get(name)
+            if wilaya and any(getattr(wilaya, f) != v for f, v in prices.items()):
+                for field, value in prices.items():
+                    setattr(wilaya, field, value)
+                changed.append(wilaya)
+        Wilaya.objects.bulk_update(changed, PRICE_FIELDS)
+
+        ids = dict(Wilaya.objects.filter(name__in=wilayas).values_list("name", "pk"))
+        known = {
+            (wilaya_id, name): pk for pk, wilaya_id, name in
+            Commune.objects.filter(wilaya_id__in=ids.values()).values_list("pk", "wilaya_id", "name")
+        }
+        wanted = {(ids[wilaya], name) for wilaya, names in communes.items() for name in names}
+        new = [Commune(wilaya_id=wilaya_id, name=name) for wilaya_id, name in sorted(wanted - known.keys())]
+        Commune.objects.bulk_create(new)
+
+        deleted = 0
+        if prune:
+            stale = [known[key] for key in known.keys() - wanted]
+            deleted, _ = Commune.objects.filter(pk__in=stale).delete()
+        return {"wilayas": len(wilayas), "created": len(new), "deleted": deleted}
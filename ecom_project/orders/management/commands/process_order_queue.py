@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.ingestion import BATCH_SIZE, process_batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the orders queued through /api/orders/queue, in batches. "
+        "Drains the queue and exits, or keeps polling with --loop. Several "
+        "workers can run at once on PostgreSQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--loop", action="store_true", help="Keep running, polling an empty queue")
+        parser.add_argument("--sleep", type=float, default=1.0, help="Seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            started = time.monotonic()
+            processed = process_batch(options["batch_size"])
+            if processed:
+                total += processed
+                elapsed = time.monotonic() - started
+                self.stdout.write(f"{processed} ticket(s) in {elapsed:.2f}s ({total} total)")
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["sleep"])
+        self.stdout.write(self.style.SUCCESS(f"Processed {total} ticket(s)."))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from orders.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Deletes expired Idempotency-Key records (settings.IDEMPOTENCY_KEY_TTL)."
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f"Deleted {purge_expired()} expired key(s)."))
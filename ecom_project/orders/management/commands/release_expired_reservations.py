@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from orders.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Releases stock held by pending orders whose reservation expired "
+        "(settings.STOCK_RESERVATION_TTL). Run it from cron every few minutes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = 0
+        while released := release_expired(limit=options["batch_size"]):
+            total += released
+        self.stdout.write(self.style.SUCCESS(f"Released {total} expired reservation(s)."))
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_stockreservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=50)),
+                ('key', models.CharField(max_length=255)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('status', models.CharField(default='in_progress', max_length=20)),
+                ('started_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('response_status', models.PositiveSmallIntegerField(null=True)),
+                ('response_content_type', models.CharField(blank=True, max_length=100)),
+                ('response_body', models.BinaryField(null=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='idempotencykey',
+            constraint=models.UniqueConstraint(fields=('scope', 'key'), name='idempotency_key_scope_key_uniq'),
+        ),
+    ]
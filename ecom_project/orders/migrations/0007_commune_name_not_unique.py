@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_orderticket'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='commune',
+            name='name',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:39
+
+from django.db import migrations, models
+from django.db.models import Case, Value, When
+
+
+def backfill_status_rank(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    Order.objects.update(
+        status_rank=Case(
+            When(order_status__iexact='pending', then=Value(0)),
+            When(order_status__iexact='accepted', then=Value(1)),
+            When(order_status__iexact='rejected', then=Value(2)),
+            default=Value(3),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_commune_name_not_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='status_rank',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_status_rank, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status_rank', '-order_date', '-id'], name='order_status_rank_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('order_status', 'Pending')), fields=['-order_date', '-id'], name='order_pending_date_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+INDEX = "order_costumer_name_upper_like"
+
+
+def create_index(apps, schema_editor):
+    # The admin's name search is costumer_name__istartswith, which PostgreSQL
+    # runs as UPPER("costumer_name"::text) LIKE UPPER(%s). A prefix LIKE only
+    # uses a pattern_ops index, which a Meta index can't declare portably.
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {INDEX} "
+            "ON orders_order (UPPER(costumer_name::text) text_pattern_ops)"
+        )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_idempotencykey_response_headers'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
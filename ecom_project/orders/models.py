@@ -1,11 +1,17 @@
 # orders/models.py
 
+import threading
+import uuid
 from decimal import Decimal
-from django.db import models
+from django.db import models, transaction
 from phonenumber_field.modelfields import PhoneNumberField
 from products.models import Product, ProductVariant
+from products.stock import check_lines, decrement_stock
+from products.tracking import TrackedFieldsMixin
 from django.core.exceptions import ValidationError
-from django.db.models import Sum
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import Exact
 
 CHOICES = (
     ('Pending', 'Pending'),
@@ -26,7 +32,8 @@ class Wilaya(models.Model):
         return self.name
     
 class Commune(models.Model):
-    name = models.CharField(max_length=100, unique=True, db_index=True)  # Added db_index
+    # not unique on its own: several wilayas have a commune with the same name
+    name = models.CharField(max_length=100, db_index=True)  # Added db_index
     wilaya = models.ForeignKey(Wilaya, related_name='communes', on_delete=models.CASCADE, db_index=True)  # Added db_index
 
     class Meta:
@@ -38,7 +45,85 @@ class Commune(models.Model):
     def __str__(self):
         return self.name
 
-class Order(models.Model):
+# Sort key of the admin changelist: the Pending queue first
+STATUS_RANKS = {'Pending': 0, 'Accepted': 1, 'Rejected': 2}
+
+
+def status_rank(status):
+    return STATUS_RANKS.get(status, len(STATUS_RANKS))
+
+
+def status_rank_expression(status=F('order_status')):
+    """SQL equivalent of status_rank(), for UPDATE statements."""
+    if not hasattr(status, 'resolve_expression'):
+        return Value(status_rank(status))
+    return Case(
+        *[When(Exact(status, Value(name)), then=Value(rank)) for name, rank in STATUS_RANKS.items()],
+        default=Value(len(STATUS_RANKS)),
+        output_field=models.PositiveSmallIntegerField(),
+    )
+
+
+class OrderQuerySet(models.QuerySet):
+    """
+    Bulk writes bypass Order.save(), so they keep status_rank in sync
+    themselves. bulk_update() goes through update().
+    """
+
+    def update(self, **kwargs):
+        if 'order_status' in kwargs and 'status_rank' not in kwargs:
+            kwargs['status_rank'] = status_rank_expression(kwargs['order_status'])
+        return super().update(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.status_rank = status_rank(obj.order_status)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def retotal(self, ids=None):
+        """
+        Sets total_amount = sum of the stored item prices + delivery_fees
+        for the orders in this queryset (restricted to `ids` when given),
+        in one UPDATE.
+        """
+        orders = self if ids is None else self.filter(pk__in=list(ids))
+        items_total = (
+            OrderItem.objects
+            .filter(order=OuterRef('pk'))
+            .order_by().values('order')
+            .annotate(total=Sum('price'))
+            .values('total')
+        )
+        amount = models.DecimalField(max_digits=10, decimal_places=2)
+        return orders.update(
+            total_amount=Coalesce(Subquery(items_total), Value(Decimal('0')), output_field=amount) + F('delivery_fees')
+        )
+
+
+_pending = threading.local()
+
+
+def _flush_retotals():
+    order_ids = getattr(_pending, 'order_ids', None)
+    if order_ids:
+        _pending.order_ids = set()
+        Order.objects.retotal(order_ids)
+
+
+def retotal_on_commit(order_ids):
+    """
+    Re-totals the given orders once the current transaction commits.
+    Requests made within one transaction are merged, so each order is
+    recomputed once however many of its items changed.
+    """
+    if not hasattr(_pending, 'order_ids'):
+        _pending.order_ids = set()
+    _pending.order_ids.update(order_ids)
+    transaction.on_commit(_flush_retotals)
+
+
+class Order(TrackedFieldsMixin, models.Model):
     costumer_name = models.CharField(max_length=100, db_index=True)  # Added db_index
     costumer_phone = PhoneNumberField(region="DZ", db_index=True)    # Added db_index
     order_date = models.DateTimeField(auto_now_add=True, db_index=True)  # Added db_index
@@ -48,95 +133,134 @@ class Order(models.Model):
     delivery_fees = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     wilaya = models.CharField(max_length=100, db_index=True)  # Added db_index
     commune = models.CharField(max_length=100, blank=True, null=True, db_index=True)  # Added db_index
+    # Derived from order_status (status_rank()), so the admin can sort the
+    # changelist on an index instead of a CASE over every row
+    status_rank = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # the changelist's default ordering
+            models.Index(fields=['status_rank', '-order_date', '-id'], name='order_status_rank_date_idx'),
+            # the Pending queue, newest first
+            models.Index(
+                fields=['-order_date', '-id'],
+                condition=Q(order_status='Pending'),
+                name='order_pending_date_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"Order {self.id} - {self.costumer_name} - {self.order_status}"
 
+    objects = OrderQuerySet.as_manager()
+    # status transitions are decided against the status the order was loaded with
+    tracked_fields = ('order_status',)
+
+    def leaves_pending(self):
+        return self.initial_value("order_status") == "Pending" and self.order_status != "Pending"
+
     def update_total(self):
-        items = self.items.select_related('product_variant', 'product_variant__product').all()
-        new_total = sum(
-            (
-                (item.product_variant.product.discount_price if item.product_variant and item.product_variant.product.discount_price not in [None, Decimal('0.00'), 0] else item.product_variant.product.price)
-                * item.quantity
-            )
-            for item in items if item.product_variant and item.product_variant.product
-        ) + (self.delivery_fees or 0)
-        self.total_amount = new_total
-        self.save(update_fields=["total_amount"])
-        
+        """Re-totals this order now (see OrderQuerySet.retotal)."""
+        Order.objects.retotal([self.pk])
+        self.refresh_from_db(fields=["total_amount"])
+
     def clean(self):
         super().clean()
         # only when editing an existing Order…
         if self.pk:
-            old_status = Order.objects.filter(pk=self.pk).values_list("order_status", flat=True).first()
             # …and only when flipping Pending→Accepted…
-            if old_status == "Pending" and self.order_status == "Accepted":
-                # Use select_related to optimize DB queries
-                for item in self.items.select_related('product_variant').all():
-                    if item.quantity > item.product_variant.stock:
-                        # attach to the order_status field
-                        raise ValidationError({
-                            "order_status": (
-                                f"Not enough stock for “{item.product_variant}” – "
-                                f"requested {item.quantity}, available {item.product_variant.stock}."
-                            )
-                        })
-                    
+            if self.leaves_pending() and self.order_status == "Accepted":
+                # same rule as allocate_stock(), so the admin form shows the
+                # problem instead of save() failing
+                from .reservations import held_by_orders
+
+                shortages = check_lines(
+                    self.items.values_list("product_variant_id", "quantity"),
+                    held=held_by_orders([self.pk])[self.pk],
+                )
+                if shortages:
+                    # attach to the order_status field
+                    raise ValidationError({"order_status": [str(s) for s in shortages]})
+
     def save(self, *args, **kwargs):
         self.full_clean()
-        is_new = self.pk is None
-        previous_status = None
-
-        if not is_new:
-            previous_status = (
-                Order.objects
-                .filter(pk=self.pk)
-                .values_list("order_status", flat=True)
-                .first()
-            )
 
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            # Saves that don't move the order out of Pending need no read.
+            # Those that do re-read the status under lock, so two admins
+            # can't both accept the same order.
+            previous_status = None
+            if self.leaves_pending():
+                previous_status = (
+                    Order.objects
+                    .select_for_update()
+                    .filter(pk=self.pk)
+                    .values_list("order_status", flat=True)
+                    .first()
+                )
+
+            if previous_status == "Pending":
+                # Same path as the admin actions: stock (including this order's
+                # reservation) is consumed or released in a few queries.
+                from .acceptance import allocate_stock
+                from .reservations import release_reservations
 
-        # only once, when Pending→Accepted:
-        if (not is_new) and (previous_status == "Pending") and (self.order_status == "Accepted"):
-            # Use select_related to optimize DB queries
-            for item in self.items.select_related('product_variant', 'product_variant__product').all():
-                item.update_stock()
-                if item.product_variant and item.product_variant.product:
-                    item.product_variant.product.sold += item.quantity
-                    item.product_variant.product.save(update_fields=['sold'])
-        # self.update_total()
+                if self.order_status == "Accepted":
+                    result, = allocate_stock([self])
+                    if not result.ok:
+                        raise ValidationError({"order_status": result.errors})
+                else:
+                    release_reservations([self.pk])
+
+            self.status_rank = status_rank(self.order_status)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'order_status' in update_fields:
+                kwargs['update_fields'] = list(dict.fromkeys([*update_fields, 'status_rank']))
+            super().save(*args, **kwargs)
+            if previous_status == "Pending" and self.order_status == "Accepted":
+                self.update_total()
 
     def bulk_add_items(self, items_data):
         """
         Efficiently add multiple OrderItems to this order using bulk_create.
-        items_data: list of dicts, each with keys: product, quantity
+        items_data: list of dicts, each with keys: product_variant, quantity
         Example:
             [
-                {"product": product1, "quantity": 2},
-                {"product": product2, "quantity": 1},
+                {"product_variant": variant1, "quantity": 2},
+                {"product_variant": variant2, "quantity": 1},
             ]
+        Load the variants with select_related('product') to keep this at a
+        fixed number of queries.
         """
-        order_items = []
-        for data in items_data:
-            variant = data["product_variant"]
-            quantity = data["quantity"]
-            product = variant.product
-            if product.discount_price not in [None, Decimal('0.00'), 0]:
-                unit_price = product.discount_price
-            else:
-                unit_price = product.price
-            price = unit_price * quantity
-            order_items.append(OrderItem(
+        order_items = [
+            OrderItem(
                 order=self,
-                product_variant=variant,
-                quantity=quantity,
-                price=price
-            ))
+                product_variant=data["product_variant"],
+                quantity=data["quantity"],
+                price=data["product_variant"].product.effective_price * data["quantity"],
+            )
+            for data in items_data
+        ]
         OrderItem.objects.bulk_create(order_items)
         # Optionally update total after bulk create
         self.update_total()
 
+class StockReservation(models.Model):
+    """
+    Units of a variant held for a pending order until expires_at. The sum
+    per variant is mirrored in ProductVariant.reserved (see
+    orders/reservations.py); expired holds are released by
+    `manage.py release_expired_reservations`.
+    """
+    order = models.ForeignKey(Order, related_name='reservations', on_delete=models.CASCADE)
+    product_variant = models.ForeignKey(ProductVariant, related_name='reservations', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_variant} held for Order {self.order_id}"
+
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE, db_index=True)
     product_variant = models.ForeignKey(ProductVariant, on_delete=models.PROTECT, blank=True, null=True, db_index=True)
@@ -144,29 +268,82 @@ class OrderItem(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
     def clean(self):
-        if self.product_variant and self.quantity > self.product_variant.stock:
-            raise ValidationError(
-                f"Only {self.product_variant.stock} units available for {self.product_variant}. You requested {self.quantity}."
-            )
+        if self.product_variant_id and self.quantity:
+            # units this item's order already holds count as available to it
+            held = {}
+            if self.order_id:
+                from .reservations import held_by_orders
+                held = held_by_orders([self.order_id])[self.order_id]
+            shortages = check_lines([(self.product_variant_id, self.quantity)], held=held)
+            if shortages:
+                raise ValidationError(str(shortages[0]))
 
     def save(self, *args, **kwargs):
         self.full_clean()
         product = self.product_variant.product if self.product_variant else None
-        if product and product.discount_price not in [None, Decimal('0.00'), 0]:
-            unit_price = product.discount_price
-        elif product:
-            unit_price = product.price
-        else:
-            self.price = 0
-            unit_price = 0
+        # the price paid, same rule as bulk_add_items() and order ingestion
+        unit_price = product.effective_price if product else 0
         self.price = unit_price * self.quantity
         super().save(*args, **kwargs)
 
     def update_stock(self):
-        if self.quantity > self.product_variant.stock:
+        result = decrement_stock([(self.product_variant_id, self.quantity)])
+        if result.shortages:
             raise ValueError("Insufficient stock to fulfill this order item.")
-        self.product_variant.stock -= self.quantity
-        self.product_variant.save(update_fields=['stock'])
 
     def __str__(self):
         return f"{self.quantity} x {self.product_variant} for Order {self.order.id}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    A client's Idempotency-Key for one endpoint (scope) and the response it
+    got, so a retried request is answered from here (see orders/idempotency.py).
+    """
+    IN_PROGRESS, COMPLETED = "in_progress", "completed"
+
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # sha256 of the request body
+    status = models.CharField(max_length=20, default=IN_PROGRESS)
+    started_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+    response_status = models.PositiveSmallIntegerField(null=True)
+    response_content_type = models.CharField(max_length=100, blank=True)
+    response_body = models.BinaryField(null=True)
+    response_headers = models.JSONField(default=dict, blank=True)  # idempotency.REPLAYED_HEADERS
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["scope", "key"], name="idempotency_key_scope_key_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key} ({self.status})"
+
+
+class OrderTicket(models.Model):
+    """
+    An order submitted through the asynchronous endpoint, waiting in this
+    table (the queue) until `manage.py process_order_queue` turns it into an
+    Order. See orders/ingestion.py.
+    """
+    QUEUED, DONE, FAILED = "queued", "done", "failed"
+    STATUS_CHOICES = ((QUEUED, "Queued"), (DONE, "Done"), (FAILED, "Failed"))
+
+    ticket = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    order = models.ForeignKey(Order, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    errors = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # the worker's "next queued tickets, oldest first"
+            models.Index(fields=['status', 'id'], name='order_ticket_status_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"Ticket {self.ticket} ({self.status})"
@@ -0,0 +1,80 @@
+"""
+Time-boxed stock reservations for pending orders.
+
+Creating an order holds its quantities (reserve_order): one locked read
+of the variants, one UPDATE of ProductVariant.reserved and one INSERT of
+StockReservation rows, all or nothing. Availability everywhere is
+stock - reserved, so concurrent checkouts can't sell the same units.
+
+A hold ends when its order is accepted (orders/acceptance.py turns it
+into a stock decrement), rejected or deleted, or when it expires and
+`manage.py release_expired_reservations` sweeps it. An order whose hold
+expired can still be accepted if enough free stock is left.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from products.stock import merge_lines, release_stock, reserve_stock
+
+from .models import StockReservation
+
+DEFAULT_RESERVATION_TTL = 72 * 60 * 60  # seconds; covers a weekend before review
+
+
+def reservation_ttl():
+    return timedelta(seconds=getattr(settings, "STOCK_RESERVATION_TTL", DEFAULT_RESERVATION_TTL))
+
+
+def reserve_order(order, lines):
+    """
+    Holds (variant_id, quantity) `lines` for `order`. Returns the
+    StockShortage list; nothing is held when it isn't empty.
+    """
+    requested = merge_lines(lines)
+    with transaction.atomic():
+        result = reserve_stock(requested.items())
+        if result.shortages:
+            return result.shortages
+        expires_at = timezone.now() + reservation_ttl()
+        StockReservation.objects.bulk_create([
+            StockReservation(order=order, product_variant_id=variant_id, quantity=quantity, expires_at=expires_at)
+            for variant_id, quantity in requested.items()
+        ])
+    return []
+
+
+def held_by_orders(order_ids):
+    """{order_id: {variant_id: quantity}} currently held, in one query."""
+    held = defaultdict(lambda: defaultdict(int))
+    for order_id, variant_id, quantity in (
+        StockReservation.objects
+        .filter(order_id__in=order_ids)
+        .values_list("order_id", "product_variant_id", "quantity")
+    ):
+        held[order_id][variant_id] += quantity
+    return held
+
+
+def _release(reservations, limit=None):
+    with transaction.atomic():
+        rows = reservations.select_for_update().order_by("pk").values_list("id", "product_variant_id", "quantity")
+        rows = list(rows[:limit] if limit else rows)
+        if not rows:
+            return 0
+        release_stock((variant_id, quantity) for _, variant_id, quantity in rows)
+        StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+    return len(rows)
+
+
+def release_reservations(order_ids):
+    """Gives back everything held for the given orders (rejected or deleted)."""
+    return _release(StockReservation.objects.filter(order_id__in=order_ids))
+
+
+def release_expired(now=None, limit=None):
+    """Sweeps up to `limit` holds past their expiry. Returns how many were released."""
+    return _release(StockReservation.objects.filter(expires_at__lte=now or timezone.now()), limit)
@@ -1,27 +1,92 @@
+from django.db import transaction
 from rest_framework import serializers
-from .models import Order, OrderItem, Wilaya, Commune
+from .delivery import DELIVERY_TYPES, BUREAU, UnknownDestination, quote
+from .models import Order, OrderItem, OrderTicket, Wilaya, Commune
+from .reservations import reserve_order
+from products.models import ProductVariant
 from products.serializers import Product
 
 
+class VariantField(serializers.PrimaryKeyRelatedField):
+    """
+    Resolves the variant from the map OrderItemListSerializer preloaded for
+    the whole order, instead of one query per line.
+    """
+
+    def to_internal_value(self, data):
+        variants = getattr(self.parent.parent, 'variants', None)
+        if variants is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            variant = variants.get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if variant is None:
+            self.fail('does_not_exist', pk_value=data)
+        return variant
+
+
+class OrderItemListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        # every variant of the order, with its product, in one query
+        ids = set()
+        for item in data if isinstance(data, list) else ():
+            try:
+                ids.add(int(item['product_variant']))
+            except (KeyError, TypeError, ValueError):
+                pass
+        self.variants = ProductVariant.objects.select_related('product').in_bulk(ids)
+        return super().to_internal_value(data)
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
+    product_variant = VariantField(queryset=ProductVariant.objects.select_related('product'))
+
     class Meta:
         model = OrderItem
         fields = ['id', 'product_variant', 'quantity', 'price']
         read_only_fields = ['id', 'price']
+        list_serializer_class = OrderItemListSerializer
 
     def validate(self, attrs):
         if attrs['quantity'] <= 0:
             raise serializers.ValidationError("Quantity must be greater than zero.")
-        if attrs['quantity'] > attrs['product_variant'].stock:
+        # stock held by other pending orders can't be promised again;
+        # reserve_order() re-checks this under lock
+        if attrs['quantity'] > attrs['product_variant'].available:
             raise serializers.ValidationError("Insufficient stock for this variant.")
         return attrs
 
 
+def delivery_fields(wilaya, commune, delivery_type):
+    """Canonical wilaya / commune and the fees, as Order field values."""
+    try:
+        destination = quote(wilaya, commune, delivery_type)
+    except UnknownDestination as e:
+        raise serializers.ValidationError({e.field: str(e)})
+    return {
+        'wilaya': destination.wilaya,
+        'commune': destination.commune,
+        'delivery_fees': destination.delivery_fees,
+    }
+
+
+class DeliveryQuoteSerializer(serializers.Serializer):
+    wilaya = serializers.CharField(max_length=100)
+    commune = serializers.CharField(max_length=100, required=False, allow_blank=True, allow_null=True)
+    delivery_type = serializers.ChoiceField(choices=DELIVERY_TYPES, default=BUREAU)
+    delivery_fees = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+
+    def validate(self, data):
+        data.update(delivery_fields(data['wilaya'], data.get('commune'), data['delivery_type']))
+        return data
+
+
 class OrderSerializer(serializers.ModelSerializer):
     # We need to expose delivery_type, wilaya, commune
-    delivery_type = serializers.ChoiceField(
-        choices=(("A Domicile", "A Domicile"), ("Bureau", "Bureau"))
-    )
+    delivery_type = serializers.ChoiceField(choices=DELIVERY_TYPES)
     # Assuming wilaya and commune are ForeignKeys in Order → we use PrimaryKeyRelatedField
     items = OrderItemSerializer(many=True)
 
@@ -40,7 +105,8 @@ class OrderSerializer(serializers.ModelSerializer):
             'total_amount',
             'items',
         ]
-        read_only_fields = ['id', 'order_date', 'total_amount', 'order_status']
+        # delivery_fees is computed from the destination (orders/delivery.py)
+        read_only_fields = ['id', 'order_date', 'delivery_fees', 'total_amount', 'order_status']
 
     def validate(self, data):
         """
@@ -63,8 +129,10 @@ class OrderSerializer(serializers.ModelSerializer):
 
         #         })
 
+        data.update(delivery_fields(wilaya, commune, delivery_type))
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         items_data = validated_data.pop('items')
         order = Order.objects.create(**validated_data)
@@ -76,5 +144,18 @@ class OrderSerializer(serializers.ModelSerializer):
                 "quantity": item_data["quantity"],
             })
 
+        # Hold the stock until the order is accepted or rejected; rolls the
+        # whole order back if another checkout got there first.
+        shortages = reserve_order(order, [(i["product_variant"].pk, i["quantity"]) for i in bulk_items])
+        if shortages:
+            raise serializers.ValidationError({'items': [str(s) for s in shortages]})
+
         order.bulk_add_items(bulk_items)
-        return order
\ No newline at end of file
+        return order
+
+
+class OrderTicketSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderTicket
+        fields = ['ticket', 'status', 'order', 'errors', 'created_at', 'processed_at']
+        read_only_fields = fields
@@ -1,7 +1,25 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from .models import Order, OrderItem
+from .delivery import delivery_changed
+from .models import Commune, Order, OrderItem, Wilaya, retotal_on_commit
+from .reservations import release_reservations
+
+
+@receiver(post_save, sender=Wilaya)
+@receiver(post_delete, sender=Wilaya)
+@receiver(post_save, sender=Commune)
+@receiver(post_delete, sender=Commune)
+def refresh_delivery_table(sender, **kwargs):
+    delivery_changed()
+
+
+@receiver(pre_delete, sender=Order)
+def release_order_reservations(sender, instance, **kwargs):
+    # The cascade would drop the rows without giving the units back.
+    release_reservations([instance.pk])
+
 @receiver(post_save, sender=OrderItem)
 @receiver(post_delete, sender=OrderItem)
 def update_order_total(sender, instance, **kwargs):
-    instance.order.update_total()
\ No newline at end of file
+    # merged per transaction: editing n inline rows re-totals the order once
+    retotal_on_commit([instance.order_id])
\ No newline at end of file
@@ -1,3 +1,424 @@
-from django.test import TestCase
+import os
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import StringIO
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from products.models import Product, ProductVariant
+
+from .acceptance import accept_orders, reject_orders
+from .exports import export_orders_queryset
+from .ingestion import process_batch
+from .models import Commune, IdempotencyKey, Order, OrderItem, Wilaya
+
+
+class AcceptanceEngineTests(TestCase):
+    def setUp(self):
+        product = Product.objects.create(name="Shoe", description="d", price=100, discount_price=80)
+        self.variant = ProductVariant.objects.create(product=product, size="42", stock=3)
+
+    def order(self, quantity):
+        order = Order.objects.create(costumer_name="c", costumer_phone="+213555123456", wilaya="Alger", delivery_fees=10)
+        OrderItem.objects.create(order=order, product_variant=self.variant, quantity=quantity)
+        return order
+
+    def test_oldest_orders_get_the_stock_first(self):
+        first, second, third = self.order(2), self.order(2), self.order(1)
+        results = {r.order_id: r for r in accept_orders(Order.objects.all())}
+
+        self.assertTrue(results[first.pk].ok)
+        self.assertFalse(results[second.pk].ok)
+        self.assertTrue(results[third.pk].ok)
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 0)
+        self.assertEqual(Product.objects.get().sold, 3)
+        first.refresh_from_db()
+        self.assertEqual((first.order_status, first.total_amount), ("Accepted", 170))
+
+    def test_totals_use_the_prices_stored_at_checkout(self):
+        by_action, by_save = self.order(1), self.order(1)
+        product = Product.objects.get()
+        product.discount_price = 50
+        product.save()
+
+        accept_orders(Order.objects.filter(pk=by_action.pk))
+        by_save.order_status = "Accepted"
+        by_save.save()
+
+        by_action.refresh_from_db()
+        self.assertEqual(by_action.total_amount, 90)
+        self.assertEqual(by_save.total_amount, 90)
+        self.assertEqual(Order.objects.get(pk=by_save.pk).total_amount, 90)
+
+    def test_only_pending_orders_change(self):
+        order = self.order(1)
+        self.assertTrue(reject_orders(Order.objects.all())[0].ok)
+        result, = accept_orders(Order.objects.all())
+        self.assertFalse(result.ok)
+        order.refresh_from_db()
+        self.assertEqual(order.order_status, "Rejected")
+
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        Wilaya.objects.create(name="Alger", domicile_price=20, bureau_price=10)
+        product = Product.objects.create(name="Shoe", description="d", price=100)
+        self.variant = ProductVariant.objects.create(product=product, size="42", stock=3)
+
+    def checkout(self, quantity):
+        return self.client.post("/api/orders/create", {
+            "costumer_name": "c", "costumer_phone": "+213555123456",
+            "delivery_type": "Bureau", "wilaya": "Alger",
+            "items": [{"product_variant": self.variant.pk, "quantity": quantity}],
+        }, content_type="application/json")
+
+    def test_pending_orders_hold_stock_until_rejected(self):
+        first = self.checkout(2)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(self.checkout(2).status_code, 400)
+
+        reject_orders(Order.objects.filter(pk=first.json()["id"]))
+        self.variant.refresh_from_db()
+        self.assertEqual((self.variant.stock, self.variant.reserved), (3, 0))
+        self.assertEqual(self.checkout(2).status_code, 201)
+
+    def test_acceptance_consumes_the_reservation(self):
+        order_id = self.checkout(3).json()["id"]
+        result, = accept_orders(Order.objects.filter(pk=order_id))
+        self.assertTrue(result.ok)
+        self.variant.refresh_from_db()
+        self.assertEqual((self.variant.stock, self.variant.reserved), (0, 0))
+
+    def test_clean_counts_stock_held_by_other_orders(self):
+        # order A holds all 3 units, then an admin-created order B asks for 1
+        self.checkout(3)
+        order_b = Order.objects.create(costumer_name="b", costumer_phone="+213555123456", wilaya="Alger")
+        with self.assertRaises(ValidationError):
+            OrderItem(order=order_b, product_variant=self.variant, quantity=1).full_clean()
+        OrderItem.objects.bulk_create([OrderItem(order=order_b, product_variant=self.variant, quantity=1)])
+
+        order_b.order_status = "Accepted"
+        with self.assertRaises(ValidationError) as raised:
+            order_b.full_clean()
+        self.assertIn("available 0", str(raised.exception.message_dict["order_status"]))
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        Wilaya.objects.create(name="Alger", domicile_price=20, bureau_price=10)
+        product = Product.objects.create(name="Shoe", description="d", price=100)
+        self.variant = ProductVariant.objects.create(product=product, size="42", stock=5)
+
+    def post(self, key, name="c"):
+        return self.client.post("/api/orders/create", {
+            "costumer_name": name, "costumer_phone": "+213555123456",
+            "delivery_type": "Bureau", "wilaya": "Alger",
+            "items": [{"product_variant": self.variant.pk, "quantity": 1}],
+        }, content_type="application/json", HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_original_response(self):
+        first = self.post("abc")
+        retry = self.post("abc")
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_replay_keeps_the_ticket_location(self):
+        def enqueue():
+            return self.client.post("/api/orders/queue", {
+                "costumer_name": "c", "costumer_phone": "+213555123456",
+                "delivery_type": "Bureau", "wilaya": "Alger",
+                "items": [{"product_variant": self.variant.pk, "quantity": 1}],
+            }, content_type="application/json", HTTP_IDEMPOTENCY_KEY="queued")
+
+        first, retry = enqueue(), enqueue()
+        self.assertEqual((retry.status_code, retry["Idempotent-Replayed"]), (202, "true"))
+        self.assertEqual(retry["Location"], first["Location"])
+        self.assertEqual(self.client.get(retry["Location"]).json()["status"], "queued")
+
+    def test_request_that_lost_its_key_rolls_back(self):
+        def taken_over(sender, instance, created, **kwargs):
+            # a retry declared this request dead and claimed the key meanwhile
+            IdempotencyKey.objects.filter(key="slow").update(started_at=timezone.now() + timedelta(seconds=1))
+
+        post_save.connect(taken_over, sender=Order, dispatch_uid="idempotency-takeover")
+        self.addCleanup(post_save.disconnect, sender=Order, dispatch_uid="idempotency-takeover")
+        self.assertEqual(self.post("slow").status_code, 409)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_key_reused_with_another_body_is_rejected(self):
+        self.post("abc")
+        self.assertEqual(self.post("abc", name="other").status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class OrderQueueTests(TestCase):
+    def setUp(self):
+        Wilaya.objects.create(name="Alger", domicile_price=20, bureau_price=10)
+        product = Product.objects.create(name="Shoe", description="d", price=100, discount_price=80)
+        self.variant = ProductVariant.objects.create(product=product, size="42", stock=3)
+
+    def enqueue(self, quantity):
+        response = self.client.post("/api/orders/queue", {
+            "costumer_name": "c", "costumer_phone": "+213555123456",
+            "delivery_type": "Bureau", "wilaya": "Alger",
+            "items": [{"product_variant": self.variant.pk, "quantity": quantity}],
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 202)
+        return response
+
+    def test_worker_creates_orders_in_arrival_order(self):
+        first, second, third = self.enqueue(2), self.enqueue(2), self.enqueue(1)
+        self.assertEqual(Order.objects.count(), 0)
+
+        self.assertEqual(process_batch(), 3)
+        self.assertEqual(process_batch(), 0)
+
+        first, second, third = (self.client.get(r["Location"]).json() for r in (first, second, third))
+        self.assertEqual((first["status"], second["status"], third["status"]), ("done", "failed", "done"))
+        order = Order.objects.get(pk=first["order"])
+        self.assertEqual((order.order_status, order.total_amount), ("Pending", 170))
+        self.assertEqual(order.reservations.get().quantity, 2)
+        self.variant.refresh_from_db()
+        self.assertEqual((self.variant.stock, self.variant.reserved), (3, 3))
+
+
+class DeliveryQuoteTests(TestCase):
+    def setUp(self):
+        alger = Wilaya.objects.create(name="Alger", domicile_price=600, bureau_price=400)
+        Commune.objects.create(name="Bab Ezzouar", wilaya=alger)
+
+    def get_quote(self, **params):
+        return self.client.get("/api/orders/delivery-quote", params)
+
+    def test_fees_come_from_the_wilaya_table_without_queries(self):
+        self.get_quote(wilaya="Alger")
+        with self.assertNumQueries(0):
+            response = self.get_quote(wilaya=" alger ", commune="bab ezzouar", delivery_type="A Domicile")
+        self.assertEqual(response.json(), {
+            "wilaya": "Alger", "commune": "Bab Ezzouar",
+            "delivery_type": "A Domicile", "delivery_fees": "600.00",
+        })
+
+    def test_unknown_destinations_are_rejected(self):
+        self.assertIn("wilaya", self.get_quote(wilaya="Atlantis").json())
+        self.assertIn("commune", self.get_quote(wilaya="Alger", commune="Oran").json())
+
+    def test_table_follows_price_changes(self):
+        self.assertEqual(self.get_quote(wilaya="Alger").json()["delivery_fees"], "400.00")
+        alger = Wilaya.objects.get(name="Alger")
+        alger.bureau_price = 450
+        alger.save()
+        self.assertEqual(self.get_quote(wilaya="Alger").json()["delivery_fees"], "450.00")
+
+
+class WilayaTreeTests(TestCase):
+    def test_loader_and_tree(self):
+        path = os.path.join(tempfile.mkdtemp(), "wilayas.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("wilaya,commune,domicile_price,bureau_price\n")
+            f.write("Alger,Bab Ezzouar,600,400\nAlger,Hydra,,\nBlida,Hydra,800,500\n")
+        call_command("load_wilayas", path, stdout=StringIO())
+        call_command("load_wilayas", path, stdout=StringIO())
+        self.assertEqual(Commune.objects.count(), 3)
+
+        response = self.client.get("/api/orders/wilayas")
+        self.assertEqual(response.json()[0], {
+            "name": "Alger", "domicile_price": "600.00", "bureau_price": "400.00",
+            "communes": ["Bab Ezzouar", "Hydra"],
+        })
+        self.assertIn("max-age=86400", response["Cache-Control"])
+        with self.assertNumQueries(0):
+            revalidated = self.client.get("/api/orders/wilayas", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+
+
+class OrderWriteQueryTests(TestCase):
+    def setUp(self):
+        Wilaya.objects.create(name="Alger", bureau_price=10)
+        products = Product.objects.bulk_create(
+            Product(name=f"Shoe {i}", description="d", price=100, discount_price=80) for i in range(30)
+        )
+        self.variants = ProductVariant.objects.bulk_create(
+            ProductVariant(product=product, size="42", stock=5) for product in products
+        )
+
+    def checkout(self, lines):
+        return self.client.post("/api/orders/create", {
+            "costumer_name": "c", "costumer_phone": "+213555123456",
+            "delivery_type": "Bureau", "wilaya": "Alger",
+            "items": [{"product_variant": v.pk, "quantity": 1} for v in self.variants[:lines]],
+        }, content_type="application/json")
+
+    def count_queries(self, lines):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.checkout(lines)
+        self.assertEqual(response.status_code, 201)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_line_count(self):
+        self.checkout(1)  # loads the delivery table
+        self.assertEqual(self.count_queries(1), self.count_queries(30))
+        order = Order.objects.latest("id")
+        self.assertEqual(order.total_amount, 30 * 80 + 10)
+
+    def test_unknown_variant_is_reported_on_its_line(self):
+        response = self.client.post("/api/orders/create", {
+            "costumer_name": "c", "costumer_phone": "+213555123456",
+            "delivery_type": "Bureau", "wilaya": "Alger",
+            "items": [{"product_variant": self.variants[0].pk, "quantity": 1},
+                      {"product_variant": 999999, "quantity": 1}],
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["items"][0], {})
+        self.assertIn("product_variant", response.json()["items"][1])
+
+
+class RetotalTests(TestCase):
+    def setUp(self):
+        product = Product.objects.create(name="Shoe", description="d", price=100)
+        self.variant = ProductVariant.objects.create(product=product, size="42", stock=10)
+
+    def test_item_changes_retotal_each_order_once_on_commit(self):
+        order = Order.objects.create(costumer_name="c", costumer_phone="+213555123456", wilaya="Alger", delivery_fees=10)
+        with self.captureOnCommitCallbacks(execute=True):
+            for quantity in (1, 2, 3):
+                OrderItem.objects.create(order=order, product_variant=self.variant, quantity=quantity)
+            order.refresh_from_db()
+            self.assertEqual(order.total_amount, 0)
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, 610)
+
+    def test_bulk_retotal_is_one_statement(self):
+        orders = [
+            Order.objects.create(costumer_name="c", costumer_phone="+213555123456", wilaya="Alger", delivery_fees=fees)
+            for fees in (0, 5, 7)
+        ]
+        OrderItem.objects.bulk_create(OrderItem(order=o, product_variant=self.variant, quantity=1, price=50) for o in orders[:2])
+        with self.assertNumQueries(1):
+            self.assertEqual(Order.objects.retotal(o.pk for o in orders), 3)
+        self.assertEqual(
+            list(Order.objects.order_by("id").values_list("total_amount", flat=True)), [50, 55, 7],
+        )
+
+
+class OrderSaveTests(TestCase):
+    def setUp(self):
+        product = Product.objects.create(name="Shoe", description="d", price=100)
+        self.variant = ProductVariant.objects.create(product=product, size="42", stock=3)
+        Order.objects.create(costumer_name="c", costumer_phone="+213555123456", wilaya="Alger")
+
+    def test_edit_without_status_change_reads_nothing_back(self):
+        order = Order.objects.get()
+        order.costumer_name = "d"
+        with self.assertNumQueries(3):  # SAVEPOINT, UPDATE, RELEASE
+            order.save()
+
+    def test_leaving_pending_rechecks_the_status_under_lock(self):
+        first, second = Order.objects.get(), Order.objects.get()
+        first.order_status = "Rejected"
+        first.save()
+        self.assertFalse(first.leaves_pending())
+        # loaded while Pending: the locked re-read sees it was already rejected
+        second.order_status = "Accepted"
+        second.save(update_fields=["order_status"])
+        self.assertEqual(ProductVariant.objects.get().stock, 3)
+
+
+class OrderChangelistTests(TestCase):
+    def setUp(self):
+        product = Product.objects.create(name="Shoe", description="d", price=100)
+        self.variant = ProductVariant.objects.create(product=product, size="42", stock=3)
+        self.orders = [
+            Order.objects.create(costumer_name=name, costumer_phone=phone, wilaya="Alger")
+            for name, phone in (("Amine", "+213555123456"), ("Sara", "+213661000000"), ("Amel", "+213770111222"))
+        ]
+
+    def ranks(self):
+        return dict(Order.objects.values_list("pk", "status_rank"))
+
+    def test_status_rank_follows_every_write_path(self):
+        first, second, third = self.orders
+        OrderItem.objects.create(order=first, product_variant=self.variant, quantity=1)
+        accept_orders(Order.objects.filter(pk=first.pk))    # bulk_update
+        reject_orders(Order.objects.filter(pk=second.pk))   # update
+        self.assertEqual(self.ranks(), {first.pk: 1, second.pk: 2, third.pk: 0})
+        second.refresh_from_db()
+        second.order_status = "Pending"
+        second.save(update_fields=["order_status"])
+        self.assertEqual(self.ranks()[second.pk], 0)
+
+    def search(self, term):
+        model_admin = admin.site._registry[Order]
+        results, _ = model_admin.get_search_results(None, Order.objects.all(), term)
+        return sorted(results.values_list("costumer_name", flat=True))
+
+    def test_search(self):
+        self.assertEqual(self.search("0555 12 34 56"), ["Amine"])
+        self.assertEqual(self.search("+213661000000"), ["Sara"])
+        self.assertEqual(self.search("077"), ["Amel"])
+        self.assertEqual(self.search("am"), ["Amel", "Amine"])
+        self.assertEqual(self.search(str(self.orders[1].pk)), ["Sara"])
+
+
+class VariantAutocompleteTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser("admin", "a@example.com", "pw"))
+        for name in ("Air Max", "Air Force", "Boot"):
+            product = Product.objects.create(name=name, description="d", price=100)
+            ProductVariant.objects.bulk_create(ProductVariant(product=product, size=size, stock=5) for size in ("41", "42"))
+
+    def test_search_by_name_and_size_with_stock(self):
+        params = {
+            "term": "air 42", "app_label": "orders", "model_name": "orderitem", "field_name": "product_variant",
+        }
+        with self.assertNumQueries(4):  # session, user, COUNT, one page with the products joined
+            response = self.client.get("/admin/products/productvariant/autocomplete/", params)
+        self.assertEqual(
+            [r["text"] for r in response.json()["results"]],
+            ["Air Force - Size 42 (5 in stock)", "Air Max - Size 42 (5 in stock)"],
+        )
+        self.assertEqual(response.json()["results"][0]["stock"], 5)
+
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        product = Product.objects.create(name="Shoe", description="d", price=100)
+        variant = ProductVariant.objects.create(product=product, size="42", stock=3)
+        order = Order.objects.create(costumer_name="Amine", costumer_phone="+213555123456", wilaya="Alger")
+        OrderItem.objects.create(order=order, product_variant=variant, quantity=2)
+        self.client.force_login(User.objects.create_user("staff", is_staff=True))
+
+    def test_view_streams_csv_and_rejects_bad_dates(self):
+        response = self.client.get("/api/orders/export.csv", {"status": "Pending", "since": "2024-01-01"})
+        self.assertEqual(response.status_code, 200)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn("Amine", lines[1])
+        for since in ("yesterday", "2024-02-30"):
+            response = self.client.get("/api/orders/export.csv", {"since": since})
+            self.assertEqual(response.status_code, 400, since)
+
+    @override_settings(TIME_ZONE="Africa/Algiers")
+    def test_since_starts_at_local_midnight(self):
+        # 00:30 on Jan 2nd in Algiers (UTC+1)
+        Order.objects.update(order_date=datetime(2024, 1, 1, 23, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual(export_orders_queryset(since=date(2024, 1, 2)).count(), 1)
+        self.assertEqual(export_orders_queryset(since=date(2024, 1, 3)).count(), 0)
+
+    def test_command_writes_to_its_stdout(self):
+        out = StringIO()
+        call_command("export_orders", "--format", "ndjson", stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 1)
+        self.assertTrue(out.getvalue().endswith("}\n"))
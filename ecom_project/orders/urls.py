@@ -1,7 +1,12 @@
-from django.urls import path,include
-from .views import OrderCreateView
+from django.urls import path,include,re_path
+from .views import DeliveryQuoteView, OrderCreateView, OrderExportView, OrderQueueView, OrderTicketView, WilayaTreeView
 
 
 urlpatterns = [
     path('create', OrderCreateView.as_view(), name='order-create'),
+    path('queue', OrderQueueView.as_view(), name='order-queue'),
+    path('tickets/<uuid:ticket>', OrderTicketView.as_view(), name='order-ticket'),
+    path('wilayas', WilayaTreeView.as_view(), name='wilaya-tree'),
+    path('delivery-quote', DeliveryQuoteView.as_view(), name='delivery-quote'),
+    re_path(r'^export\.(?P<fmt>csv|ndjson)$', OrderExportView.as_view(), name='order-export'),
 ]
@@ -1,13 +1,116 @@
+from django.http import HttpResponse
 from django.shortcuts import render
+from django.utils.dateparse import parse_date
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import etag
+from rest_framework.exceptions import ValidationError
+from rest_framework import status
 from rest_framework.generics import ListAPIView, RetrieveAPIView , CreateAPIView
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.views import APIView
 
-from .serializers import OrderSerializer
+from products.exports import ExportAPIView
+from .exports import export_orders, export_orders_queryset
+from .delivery import table as delivery_table
+from .idempotency import idempotent
+from .models import CHOICES
+from .ingestion import enqueue
+from .models import OrderTicket
+from .serializers import DeliveryQuoteSerializer, OrderSerializer, OrderTicketSerializer
 # Create your views here.
 
+WILAYA_TREE_MAX_AGE = 24 * 60 * 60
 
 
+
+@method_decorator(idempotent("orders:create"), name="dispatch")
 class OrderCreateView(CreateAPIView):
     """
     View to create a new order.
+    Retries carrying the same Idempotency-Key header get the original response.
     """
     serializer_class = OrderSerializer  
+
+
+@method_decorator(idempotent("orders:queue"), name="dispatch")
+class OrderQueueView(CreateAPIView):
+    """
+    Asynchronous order creation for peak traffic: the order is validated
+    and queued, and 202 is returned with a ticket. A worker
+    (`manage.py process_order_queue`) creates it later; poll the
+    ticket's Location for the outcome.
+    """
+    serializer_class = OrderSerializer
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ticket = enqueue(serializer.validated_data)
+        location = reverse('order-ticket', kwargs={'ticket': ticket.ticket}, request=request)
+        return Response(
+            OrderTicketSerializer(ticket).data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': location},
+        )
+
+
+class OrderTicketView(RetrieveAPIView):
+    """
+    Status of a queued order: queued, done (with the order id) or failed (with errors).
+    """
+    queryset = OrderTicket.objects.all()
+    serializer_class = OrderTicketSerializer
+    lookup_field = 'ticket'
+
+
+class DeliveryQuoteView(APIView):
+    """
+    Delivery fees for ?wilaya=&commune=&delivery_type=, as charged by /create.
+    Answered from the in-memory wilaya table, without database queries.
+    """
+
+    def get(self, request):
+        serializer = DeliveryQuoteSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.data)
+
+
+@method_decorator(etag(lambda request: delivery_table.tree()[1]), name='dispatch')
+class WilayaTreeView(APIView):
+    """
+    Every wilaya with its delivery prices and communes, in one response:
+    [{"name", "domicile_price", "bureau_price", "communes": [...]}, ...].
+    The body is rendered once per change of the reference tables
+    (orders/delivery.py); clients keep it for a day and revalidate with
+    the strong ETag.
+    """
+
+    def get(self, request):
+        body, _ = delivery_table.tree()
+        response = HttpResponse(body, content_type='application/json')
+        patch_cache_control(response, public=True, max_age=WILAYA_TREE_MAX_AGE)
+        return response
+
+
+class OrderExportView(ExportAPIView):
+    """
+    Staff only: orders with their items, as CSV or NDJSON.
+    Optional filters: ?status=Pending and ?since=YYYY-MM-DD.
+    """
+    export_filename = "orders"
+
+    def get_export(self, request, fmt):
+        status = request.query_params.get("status")
+        if status and status not in dict(CHOICES):
+            raise ValidationError({"status": f"Must be one of {', '.join(dict(CHOICES))}."})
+        since = request.query_params.get("since")
+        if since:
+            try:
+                since = parse_date(since)
+            except ValueError:  # well formed but not a date, e.g. 2024-02-30
+                since = None
+            if since is None:
+                raise ValidationError({"since": "Use YYYY-MM-DD."})
+        return export_orders(fmt, export_orders_queryset(status=status, since=since))
@@ -1,10 +1,14 @@
 from decimal import Decimal
 from django.contrib import admin, messages
+from django.contrib.admin.views.autocomplete import AutocompleteJsonView
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.urls import path
 from django.utils.html import format_html
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 from django.forms.models import BaseInlineFormSet
 
+from .images import resolver
 from .models import Product, Category, ProductImage, ProductVariant
 
 
@@ -49,7 +53,7 @@ class ProductImageInline(admin.TabularInline):
         if obj.image:
             return format_html(
                 '<img src="{}" style="height:100px; width:auto; object-fit:contain; border:1px solid #ccc;" loading="lazy"/>',
-                obj.image.url
+                resolver.variants(obj.image.name)['thumbnail']
             )
         return "(no image)"
     image_preview.short_description = "Preview"
@@ -64,6 +68,48 @@ class ProductVariantInline(admin.TabularInline):
     verbose_name_plural = "Available Sizes"
 
 
+def variant_label(variant):
+    # variants must come with select_related('product')
+    return f"{variant.product.name} - Size {variant.size} ({variant.available} in stock)"
+
+
+class VariantAutocompleteJsonView(AutocompleteJsonView):
+    """The admin autocomplete endpoint, with the stock of each variant."""
+
+    def serialize_result(self, obj, to_field_name):
+        result = super().serialize_result(obj, to_field_name)
+        result.update(text=variant_label(obj), stock=obj.available)
+        return result
+
+
+class VariantAutocompleteSelect(AutocompleteSelect):
+    """
+    Variant picker for foreign keys to ProductVariant: searches through
+    ProductVariantAdmin, 20 results per page, labelled with the stock.
+    """
+    url_name = '%s:products_productvariant_autocomplete'
+
+
+@admin.register(ProductVariant)
+class ProductVariantAdmin(admin.ModelAdmin):
+    list_display = ("id", "product", "size", "stock", "reserved")
+    list_select_related = ("product",)
+    # words match the product name (trigram-indexed on PostgreSQL, see
+    # products/search.py) or the exact size, e.g. "air max 42"
+    search_fields = ("product__name", "=size")
+    ordering = ("product__name", "size")
+    readonly_fields = ("reserved",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("product")
+
+    def get_urls(self):
+        autocomplete = self.admin_site.admin_view(VariantAutocompleteJsonView.as_view(admin_site=self.admin_site))
+        return [
+            path("autocomplete/", autocomplete, name="products_productvariant_autocomplete"),
+        ] + super().get_urls()
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     # ⚠️ Removed image from list to boost performance
@@ -74,10 +120,11 @@ class ProductAdmin(admin.ModelAdmin):
     list_filter = ("category", DiscountedListFilter)
     search_fields = ("name",)
     ordering = ("-id",)
+    autocomplete_fields = ("category",)
 
-    readonly_fields = ("main_image_preview", "get_discounted_price")
+    readonly_fields = ("main_image_preview", "effective_price", "discount_percent")
     fields = (
-        "name", "description", "price", "discount_price", "get_discounted_price",
+        "name", "description", "price", "discount_price", "effective_price", "discount_percent",
         "category", "main_image_preview", "color", "sold",
     )
 
@@ -86,13 +133,10 @@ class ProductAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         # Avoid heavy joins for admin list view
         return super().get_queryset(request).only(
-            'id', 'name', 'price', 'discount_price', 'sold', 'category', 'color'
+            'id', 'name', 'price', 'discount_price', 'sold', 'category', 'color',
+            'effective_price', 'discount_percent'
         )
 
-    def get_discounted_price(self, obj):
-        return obj.get_discounted_price()
-    get_discounted_price.short_description = "Discounted Price"
-
     def main_image_preview(self, obj):
         main_img = obj.main_image
         if not main_img:
@@ -102,7 +146,7 @@ class ProductAdmin(admin.ModelAdmin):
         if main_img:
             return format_html(
                 '<img src="{}" style="height:60px; width:auto; object-fit:contain; border:1px solid #ccc;" loading="lazy"/>',
-                main_img.url
+                resolver.variants(main_img.name)['thumbnail']
             )
         return "(no image)"
     main_image_preview.short_description = "Main Image"
@@ -132,7 +176,7 @@ class CategoryAdmin(admin.ModelAdmin):
         if obj.image:
             return format_html(
                 '<img src="{}" style="height:50px; width:auto; object-fit:contain; border:1px solid #ccc;" loading="lazy"/>',
-                obj.image.url
+                resolver.variants(obj.image.name)['thumbnail']
             )
         return "(no image)"
     category_image_preview.short_description = "Image"
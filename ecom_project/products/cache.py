@@ -1,8 +1,46 @@
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+
+from django.conf import settings
 from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
 
 DEFAULT_TTL = 300  # 5 minutes
 
 
+def shared_cache():
+    """
+    Whether every worker reads the same cache backend. A per-process
+    backend (LocMemCache) only sees the version bumps of writes handled
+    by the same process, so entries there must stay short-lived.
+    """
+    backend = settings.CACHES["default"]["BACKEND"]
+    return not backend.endswith((".LocMemCache", ".DummyCache"))
+
+# Version namespaces. Every cached catalog response embeds the versions of
+# the namespaces it depends on in its key, so bumping a version makes all of
+# those entries unreachable at once instead of deleting them one by one.
+CATALOG = "catalog"
+
+
+def category_namespace(category_id):
+    return f"category:{category_id}"
+
+
+def product_namespace(product_id):
+    return f"product:{product_id}"
+
+
 def build_cache_key(prefix, **kwargs):
     """
     Constructs a consistent cache key from prefix and query parameters.
@@ -12,25 +50,429 @@ def build_cache_key(prefix, **kwargs):
     return f"{prefix}:" + ":".join(parts)
 
 
+# ---------------------------------------------------------------------------
+# Two-tier cache: per-process L1 in front of the shared L2 (settings.CACHES)
+# ---------------------------------------------------------------------------
+
+L1_MAX_ENTRIES = 1024
+L1_MAX_TTL = 30         # seconds; bounds cross-worker staleness of L1 copies
+STALE_TTL = 60          # seconds an expired value may still be served
+LOCK_TIMEOUT = 30       # seconds a recompute lock is held at most
+LOCK_WAIT = 5           # seconds a miss waits for another worker's recompute
+EARLY_REFRESH_BETA = 1.0
+
+
+class LocalLRU:
+    """Bounded, thread-safe in-process LRU with per-entry expiry."""
+
+    def __init__(self, max_entries=L1_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class CacheStats:
+    """Process-local hit/miss counters for get_or_set_cache."""
+
+    FIELDS = ("l1_hits", "l2_hits", "misses", "stale", "early_refreshes", "recomputes")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def incr(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict.fromkeys(self.FIELDS, 0)
+
+
+local_cache = LocalLRU()
+stats = CacheStats()
+
+
+def cache_stats():
+    return stats.snapshot()
+
+
+def _should_refresh(expiry, delta, now):
+    """
+    Probabilistic early expiration (XFetch): the closer an entry is to
+    its expiry and the slower it was to compute, the likelier a request
+    refreshes it ahead of time, so entries rarely expire under load.
+    """
+    return now - delta * EARLY_REFRESH_BETA * math.log(1.0 - random.random()) >= expiry
+
+
+def _lock_key(key):
+    return f"lock:{key}"
+
+
+def _store(key, value, timeout, delta):
+    if timeout is None:
+        cache.set(key, (value, math.inf, delta), timeout=None)
+        local_cache.set(key, (value, math.inf, delta), L1_MAX_TTL)
+        return
+    envelope = (value, time.time() + timeout, delta)
+    cache.set(key, envelope, timeout=timeout + STALE_TTL)
+    local_cache.set(key, envelope, min(timeout, L1_MAX_TTL))
+
+
+def _recompute(key, compute_fn, timeout):
+    stats.incr("recomputes")
+    started = time.time()
+    data = compute_fn()
+    _store(key, data, timeout, time.time() - started)
+    return data
+
+
+def refresh_cache(key, compute_fn, timeout=DEFAULT_TTL):
+    """Recomputes and stores a get_or_set_cache entry unconditionally."""
+    return _recompute(key, compute_fn, timeout)
+
+
+def _try_lock(key):
+    """
+    True if this caller now holds the recompute lock, False if another one
+    does, None if the backend failed (django-redis with IGNORE_EXCEPTIONS
+    returns None from add() while Redis is down).
+    """
+    added = cache.add(_lock_key(key), 1, timeout=LOCK_TIMEOUT)
+    return None if added is None else bool(added)
+
+
+def _locked_recompute(key, compute_fn, timeout):
+    try:
+        return _recompute(key, compute_fn, timeout)
+    finally:
+        cache.delete(_lock_key(key))
+
+
 def get_or_set_cache(key, compute_fn, timeout=DEFAULT_TTL):
     """
     Attempts to get from cache. If missing, computes and sets.
     compute_fn should return the data to cache.
+
+    Reads go through the in-process L1 before the shared L2. Only one
+    caller recomputes a missing or expiring key at a time; while it
+    runs, others get the stale value if there is one or wait for the
+    fresh one.
     """
-    data = cache.get(key)
-    if data is None:
-        data = compute_fn()
-        cache.set(key, data, timeout=timeout)
-    return data
+    now = time.time()
+    envelope = local_cache.get(key)
+    if envelope is not None:
+        stats.incr("l1_hits")
+    else:
+        envelope = cache.get(key)
+        if envelope is not None:
+            stats.incr("l2_hits")
+            value, expiry, _ = envelope
+            if expiry > now:
+                local_cache.set(key, envelope, min(expiry - now, L1_MAX_TTL))
+
+    if envelope is not None:
+        value, expiry, delta = envelope
+        if not _should_refresh(expiry, delta, now):
+            return value
+        locked = _try_lock(key)
+        if locked is False:
+            # Someone else is already refreshing it.
+            stats.incr("stale")
+            return value
+        if expiry > now:
+            stats.incr("early_refreshes")
+        if locked is None:
+            return _recompute(key, compute_fn, timeout)
+        return _locked_recompute(key, compute_fn, timeout)
+
+    stats.incr("misses")
+    locked = _try_lock(key)
+    if locked:
+        return _locked_recompute(key, compute_fn, timeout)
+    if locked is None:
+        # No cache backend to coordinate through: nobody to wait for.
+        return _recompute(key, compute_fn, timeout)
+
+    deadline = now + LOCK_WAIT
+    while time.time() < deadline:
+        time.sleep(0.05)
+        envelope = cache.get(key)
+        if envelope is not None:
+            return envelope[0]
+        if cache.get(_lock_key(key)) is None:
+            # Released without storing a value (uncacheable result or an
+            # error): take over instead of waiting out LOCK_WAIT.
+            locked = _try_lock(key)
+            if locked:
+                return _locked_recompute(key, compute_fn, timeout)
+            if locked is None:
+                break
+    # The other worker is taking too long; don't keep the client waiting.
+    return _recompute(key, compute_fn, timeout)
 
 
 def clear_cache_by_prefix(prefix):
     """
     Clears all keys that start with a given prefix.
     WARNING: Only works with Redis backends that support key pattern deletion.
+    Prefer bump_versions() for catalog data, it does not walk the keyspace.
     """
     from django_redis import get_redis_connection
     conn = get_redis_connection("default")
     pattern = f"{prefix}*"
     for key in conn.scan_iter(match=pattern):
         conn.delete(key)
+    local_cache.delete_prefix(prefix)
+
+
+# ---------------------------------------------------------------------------
+# Namespace versions
+# ---------------------------------------------------------------------------
+
+def _version_key(namespace):
+    return f"version:{namespace}"
+
+
+def _version_timeout():
+    # Per-process caches never see other workers' bumps: let their versions
+    # (and so the ETags derived from them) roll over on their own.
+    return None if shared_cache() else DEFAULT_TTL
+
+
+def _new_version():
+    # Versions are microsecond timestamps rather than counters: an evicted
+    # version key can never come back with a value that was already used.
+    return time.time_ns() // 1000
+
+
+def get_versions(namespaces):
+    """
+    Returns the current version of each namespace, in order.
+    Missing versions are initialised, so this never returns None. If the
+    cache backend is down (django-redis with IGNORE_EXCEPTIONS answers
+    every read with a miss), fresh versions are returned, which makes
+    every response cache lookup a miss too.
+    """
+    keys = [_version_key(ns) for ns in namespaces]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        for key in missing:
+            cache.add(key, _new_version(), timeout=_version_timeout())
+        found.update(cache.get_many(missing))
+    return [found[key] if key in found else _new_version() for key in keys]
+
+
+def bump_versions(namespaces):
+    """
+    Invalidates every cache entry built from the given namespaces. O(1) in
+    the number of cached keys.
+    """
+    version = _new_version()
+    cache.set_many({_version_key(ns): version for ns in set(namespaces)}, timeout=_version_timeout())
+
+
+_pending = threading.local()
+
+
+def _flush_pending():
+    namespaces = getattr(_pending, "namespaces", None)
+    if namespaces:
+        _pending.namespaces = set()
+        bump_versions(namespaces)
+
+
+def invalidate(namespaces):
+    """
+    Bumps the given namespaces once the current transaction commits, so a
+    concurrent request can't re-cache rows that are about to change.
+    Bumps requested within one transaction are merged.
+    """
+    if not hasattr(_pending, "namespaces"):
+        _pending.namespaces = set()
+    _pending.namespaces.update(namespaces)
+    if not getattr(_pending, "deferred", 0):
+        transaction.on_commit(_flush_pending)
+
+
+@contextmanager
+def deferred_invalidation():
+    """
+    Holds back every invalidate() issued inside the block, across any
+    number of transactions, and bumps them once on exit. For bulk jobs
+    that commit in chunks.
+    """
+    _pending.deferred = getattr(_pending, "deferred", 0) + 1
+    try:
+        yield
+    finally:
+        _pending.deferred -= 1
+        if not _pending.deferred:
+            _flush_pending()
+
+
+def versioned_key_prefix(namespaces, versions=None):
+    if versions is None:
+        versions = get_versions(namespaces)
+    return "resp:" + ":".join(f"{ns}@{v}" for ns, v in zip(namespaces, versions))
+
+
+# ---------------------------------------------------------------------------
+# Response caching
+# ---------------------------------------------------------------------------
+
+def catalog_namespaces(request, *args, **kwargs):
+    return [CATALOG]
+
+
+def category_filtered_namespaces(request, *args, **kwargs):
+    """
+    For views whose filterset handles ?category= (ProductListView): a list
+    filtered on a single category only depends on that category. Other
+    views ignore the parameter and stay on the catalog namespace.
+    """
+    category = request.GET.get("category", "")
+    if category.isdigit():
+        return [category_namespace(category)]
+    return [CATALOG]
+
+
+def product_namespaces(request, *args, **kwargs):
+    return [product_namespace(kwargs["id"])]
+
+
+def _request_versions(request, namespaces):
+    # The validators and the response cache key of one request share a single read.
+    memo = request.__dict__.setdefault("_catalog_versions", {})
+    key = tuple(namespaces)
+    if key not in memo:
+        memo[key] = get_versions(namespaces)
+    return memo[key]
+
+
+def _response_cache_key(request, namespaces):
+    query = sorted(request.GET.lists())
+    fingerprint = hashlib.md5(
+        f"{request.path}?{query}|{request.META.get('HTTP_ACCEPT', '')}".encode()
+    ).hexdigest()
+    versions = _request_versions(request, namespaces)
+    return f"{versioned_key_prefix(namespaces, versions)}:{fingerprint}"
+
+
+def time_bucket(seconds):
+    """Start (epoch seconds) of the current `seconds`-long window."""
+    return int(time.time() // seconds * seconds)
+
+
+def conditional_catalog_page(namespaces=catalog_namespaces, bucket=None):
+    """
+    ETag / Last-Modified validators derived from the namespace versions, so
+    If-None-Match / If-Modified-Since get a 304 without running the view or
+    touching the response cache. Versions are microsecond timestamps of the
+    last change, which doubles as Last-Modified.
+
+    Views whose result also depends on the clock (e.g. "created in the last
+    7 days") pass `bucket` in seconds: the validators then change at least
+    once per window, like the hourly home feed.
+    """
+    def etag(request, *args, **kwargs):
+        versions = _request_versions(request, namespaces(request, *args, **kwargs))
+        accept = request.META.get("HTTP_ACCEPT", "")
+        window = time_bucket(bucket) if bucket else ""
+        return hashlib.md5(f"{versions}|{accept}|{window}".encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        versions = _request_versions(request, namespaces(request, *args, **kwargs))
+        changed = max(versions) / 1_000_000
+        if bucket:
+            changed = max(changed, time_bucket(bucket))
+        return datetime.fromtimestamp(changed, tz=dt_timezone.utc)
+
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(view_func)
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if request.method in ("GET", "HEAD"):
+                # Let browsers and the CDN store it, but revalidate every time.
+                patch_cache_control(response, public=True, no_cache=True)
+            return response
+        return _wrapped_view
+    return decorator
+
+
+class _Uncacheable(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+def versioned_cache_page(timeout, namespaces=catalog_namespaces, bucket=None):
+    """
+    Like django's cache_page, but the key embeds the versions of the
+    namespaces returned by namespaces(request, *args, **kwargs), and
+    storage goes through get_or_set_cache (L1/L2, single-flight).
+    Only successful GET/HEAD responses are cached. With `bucket` (seconds)
+    the key also changes with the time window, see conditional_catalog_page.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view_func(request, *args, **kwargs)
+
+            def render():
+                response = view_func(request, *args, **kwargs)
+                if hasattr(response, "render") and callable(response.render):
+                    response.render()
+                if response.status_code != 200 or response.streaming:
+                    raise _Uncacheable(response)
+                return (response.status_code, response.content, list(response.items()))
+
+            key = _response_cache_key(request, namespaces(request, *args, **kwargs))
+            if bucket:
+                key = f"{key}:{time_bucket(bucket)}"
+            try:
+                status, content, headers = get_or_set_cache(key, render, timeout)
+            except _Uncacheable as e:
+                return e.response
+            response = HttpResponse(content, status=status)
+            for header, value in headers:
+                response[header] = value
+            return response
+        return _wrapped_view
+    return decorator
@@ -0,0 +1,175 @@
+"""
+Streaming CSV / NDJSON exports.
+
+Rows are read with QuerySet.iterator(chunk_size=...), which uses a
+server-side cursor on PostgreSQL and runs prefetch_related once per
+chunk, so memory stays flat however many rows are exported. Output is
+written in ~64KB pieces to a StreamingHttpResponse or a file.
+"""
+import csv
+import io
+import sys
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
+
+from products.models import Product, ProductVariant
+
+EXPORT_FORMATS = ("csv", "ndjson")
+CHUNK_SIZE = 2000
+FLUSH_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _buffered(write_rows):
+    """Runs write_rows(buffer) and yields the text it writes in FLUSH_SIZE pieces."""
+    buffer = io.StringIO()
+    for _ in write_rows(buffer):
+        if buffer.tell() >= FLUSH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream_csv(header, rows):
+    def write_rows(buffer):
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(row)
+            yield
+    return _buffered(write_rows)
+
+
+def stream_ndjson(objects):
+    encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    def write_rows(buffer):
+        for obj in objects:
+            buffer.write(encoder.encode(obj))
+            buffer.write("\n")
+            yield
+    return _buffered(write_rows)
+
+
+def streaming_export_response(chunks, fmt, filename):
+    response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[fmt])
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{fmt}"'
+    return response
+
+
+def write_export(chunks, path=None, stdout=None):
+    """
+    Writes an export to `path`, or to `stdout` (sys.stdout by default) when
+    no path is given. Commands pass their self.stdout with ending="".
+    """
+    if not path:
+        stdout = stdout or sys.stdout
+        for chunk in chunks:
+            stdout.write(chunk)
+        return
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+
+class _AnyAccept(DefaultContentNegotiation):
+    # The export format comes from the URL; an Accept: text/csv header must not 406.
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class ExportAPIView(APIView):
+    """
+    Base view for staff-only exports. The URL passes fmt ("csv" or
+    "ndjson"); subclasses implement get_export(request, fmt).
+    """
+    permission_classes = [IsAdminUser]
+    content_negotiation_class = _AnyAccept
+    export_filename = "export"
+
+    def get_export(self, request, fmt):
+        raise NotImplementedError
+
+    def get(self, request, fmt):
+        return streaming_export_response(self.get_export(request, fmt), fmt, self.export_filename)
+
+
+# ---------------------------------------------------------------------------
+# Products
+# ---------------------------------------------------------------------------
+
+# Same columns as the import_catalog command reads, so an export can be re-imported.
+PRODUCT_CSV_HEADER = [
+    "id", "category", "name", "description", "price", "discount_price",
+    "color", "size", "stock", "image",
+]
+
+
+def export_products_queryset():
+    return (
+        Product.objects
+        .select_related("category")
+        .only(
+            "id", "name", "description", "price", "discount_price", "color",
+            "main_image", "category__name",
+        )
+        .prefetch_related(Prefetch(
+            "variants",
+            queryset=ProductVariant.objects.only("id", "product_id", "size", "stock").order_by("size"),
+        ))
+        .order_by("id")
+    )
+
+
+def _product_fields(product):
+    return {
+        "id": product.id,
+        "category": product.category.name if product.category else None,
+        "name": product.name,
+        "description": product.description,
+        "price": product.price,
+        "discount_price": product.discount_price,
+        "color": product.color,
+        "image": product.main_image.name or None,
+    }
+
+
+def product_csv_rows(queryset, chunk_size=CHUNK_SIZE):
+    """One row per variant; products without variants get one row with no size."""
+    for product in queryset.iterator(chunk_size=chunk_size):
+        fields = _product_fields(product)
+        base = [
+            fields["id"], fields["category"], fields["name"], fields["description"],
+            fields["price"], fields["discount_price"], fields["color"],
+        ]
+        variants = product.variants.all()
+        for variant in variants:
+            yield base + [variant.size, variant.stock, fields["image"]]
+        if not variants:
+            yield base + [None, None, fields["image"]]
+
+
+def product_objects(queryset, chunk_size=CHUNK_SIZE):
+    for product in queryset.iterator(chunk_size=chunk_size):
+        obj = _product_fields(product)
+        obj["variants"] = [{"size": v.size, "stock": v.stock} for v in product.variants.all()]
+        yield obj
+
+
+def export_products(fmt, queryset=None, chunk_size=CHUNK_SIZE):
+    """Yields the text of a product export in `fmt` ("csv" or "ndjson")."""
+    queryset = export_products_queryset() if queryset is None else queryset
+    if fmt == "csv":
+        return stream_csv(PRODUCT_CSV_HEADER, product_csv_rows(queryset, chunk_size))
+    return stream_ndjson(product_objects(queryset, chunk_size))
@@ -0,0 +1,107 @@
+"""
+Fast read path for the product list endpoints.
+
+Rows are read with .values() and mapped through a precompiled field table
+instead of instantiating models and a ModelSerializer per row. They are
+rendered with orjson when it is installed. The output is byte-for-byte
+what ProductListSerializer + JSONRenderer produce. products/tests.py and
+`manage.py benchmark_list_rendering` check that.
+"""
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+from .images import resolver
+from .models import Product
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer that encodes with orjson when it can produce identical bytes."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=JSONEncoder().default, option=orjson.OPT_NON_STR_KEYS)
+        except (orjson.JSONEncodeError, TypeError):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same JavaScript-safety escaping as JSONRenderer.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+def _decimal_field(name):
+    model_field = Product._meta.get_field(name)
+    return serializers.DecimalField(
+        max_digits=model_field.max_digits, decimal_places=model_field.decimal_places
+    ).to_representation
+
+
+def _nullable(convert):
+    return lambda value: None if value is None else convert(value)
+
+
+class RowBuilder:
+    """
+    Maps .values() rows to output dicts through a fixed
+    (output key, column, converter) table.
+    """
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self.columns = tuple(column for _, column, _ in self.fields)
+
+    def __call__(self, row):
+        return {
+            key: convert(row[column]) if convert else row[column]
+            for key, column, convert in self.fields
+        }
+
+    def build(self, rows):
+        return [self(row) for row in rows]
+
+
+# Mirrors ProductListSerializer.Meta.fields, in order.
+product_list_row = RowBuilder([
+    ('id', 'id', None),
+    ('name', 'name', None),
+    ('price', 'price', _decimal_field('price')),
+    ('discount_price', 'discount_price', _nullable(_decimal_field('discount_price'))),
+    ('main_image_url', 'main_image_name', resolver.url),
+    ('main_image_variants', 'main_image_name', resolver.variants),
+    ('category', 'category_id', None),
+])
+
+
+class FastProductListMixin:
+    """
+    For ListAPIViews whose get_queryset() is annotated with
+    Product.objects.with_main_image(): lists through product_list_row
+    instead of ProductListSerializer.
+    """
+    renderer_classes = [
+        FastJSONRenderer if renderer is JSONRenderer else renderer
+        for renderer in api_settings.DEFAULT_RENDERER_CLASSES
+    ]
+    row_builder = product_list_row
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        key_columns = [f.lstrip('-') for f in getattr(self, 'cursor_ordering', ())]
+        rows = queryset.values(*dict.fromkeys([*self.row_builder.columns, *key_columns]))
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.row_builder.build(page))
+        return Response(self.row_builder.build(rows))
@@ -1,9 +1,12 @@
 from django_filters import rest_framework as filters
+from rest_framework.filters import OrderingFilter, SearchFilter
 from .models import Product
+from .search import search_products
 
 class ProductFilter(filters.FilterSet):
-    price_min = filters.NumberFilter(field_name="price", lookup_expr='gte')
-    price_max = filters.NumberFilter(field_name="price", lookup_expr='lte')
+    # on the price actually paid, so discounted products match their sale price
+    price_min = filters.NumberFilter(field_name="effective_price", lookup_expr='gte')
+    price_max = filters.NumberFilter(field_name="effective_price", lookup_expr='lte')
     in_stock = filters.BooleanFilter(method='filter_in_stock')
 
     class Meta:
@@ -12,5 +15,38 @@ class ProductFilter(filters.FilterSet):
 
     def filter_in_stock(self, queryset, name, value):
         if value:
-            return queryset.filter(variants__stock__gt=0).distinct()
-        return queryset
\ No newline at end of file
+            return queryset.filter(in_stock=True)
+        return queryset
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    ?search= backed by the full-text index (products/search.py) instead of
+    ILIKE over search_fields. Results are ordered by relevance.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get(self.search_param, '').replace('\x00', '').strip()
+        if not term:
+            return queryset
+        return search_products(queryset, term)
+
+
+class ProductOrderingFilter(OrderingFilter):
+    """
+    ?ordering=effective_price (cheapest first), -discount_percent (biggest
+    deals first), ... Each ordering gets an id tiebreaker in the same
+    direction, so it matches the (field, id) indexes and can be used as
+    a keyset cursor ordering.
+    """
+    ordering_fields = ['effective_price', 'discount_percent', 'created_at', 'sold']
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        ordering = [field for field in ordering if field.lstrip('-') != 'id']
+        if not ordering:
+            return ['id']
+        tiebreaker = '-id' if ordering[0].startswith('-') else 'id'
+        return [*ordering, tiebreaker]
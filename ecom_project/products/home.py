@@ -0,0 +1,81 @@
+"""
+Precomputed storefront home feed.
+
+The four homepage sections (discounted, new, top ordered, categories) are
+rendered to JSON once and stored under a single cache key.
+/api/products/home/ then serves that payload with one cache read and no
+ORM work. The key embeds the catalog namespace version, so every catalog
+change (saves, stock and sold updates, bulk price updates; see
+products/signal.py and products/models.py) retires the snapshot, and the
+next request rebuilds it once (single-flight, see get_or_set_cache) rather
+than the request that made the change. `manage.py rebuild_home_feed`
+warms it. Expiry still matters because the "new" section depends on the
+clock.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .cache import CATALOG, DEFAULT_TTL, get_or_set_cache, refresh_cache, shared_cache, versioned_key_prefix
+from .models import Product, Category
+
+HOME_FEED_KEY = "home:feed"
+# A per-process cache only sees its own process's version bumps (see products/views.py).
+HOME_FEED_TTL = 60 * 60 if shared_cache() else DEFAULT_TTL  # 1 hour / 5 minutes
+HOME_SECTION_SIZE = 4
+
+
+def _home_products():
+    return (
+        Product.objects
+            .only('id', 'name', 'price', 'discount_price', 'category', 'main_image', 'created_at')
+            .with_main_image()
+            .select_related('category')
+    )
+
+
+def home_discounted_products():
+    return (
+        _home_products()
+            .filter(discount_percent__gt=0)
+            .order_by('-discount_percent', '-id')[:HOME_SECTION_SIZE]
+    )
+
+
+def home_new_products():
+    cutoff = timezone.now() - timedelta(days=7)
+    return (
+        _home_products()
+            .filter(created_at__gte=cutoff)
+            .order_by('-created_at')[:HOME_SECTION_SIZE]
+    )
+
+
+def home_top_ordered_products():
+    return _home_products().order_by('-sold')[:HOME_SECTION_SIZE]
+
+
+def render_home_feed():
+    """Builds the feed payload (JSON bytes) from the database."""
+    from .serializers import ProductListSerializer, CategorySerializer
+
+    data = {
+        "discounted": ProductListSerializer(home_discounted_products(), many=True).data,
+        "new": ProductListSerializer(home_new_products(), many=True).data,
+        "top_ordered": ProductListSerializer(home_top_ordered_products(), many=True).data,
+        "categories": CategorySerializer(Category.objects.all(), many=True).data,
+    }
+    return JSONRenderer().render(data)
+
+
+def home_feed_key():
+    return f"{versioned_key_prefix([CATALOG])}:{HOME_FEED_KEY}"
+
+
+def get_home_feed():
+    return get_or_set_cache(home_feed_key(), render_home_feed, HOME_FEED_TTL)
+
+
+def rebuild_home_feed():
+    return refresh_cache(home_feed_key(), render_home_feed, HOME_FEED_TTL)
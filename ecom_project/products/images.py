@@ -0,0 +1,77 @@
+"""
+Image URL resolution for Product.main_image, ProductImage.image and
+Category.image.
+
+Building a URL through the storage backend (Cloudinary builds it in
+Python) costs CPU on every field access, so URLs are memoized per stored
+name. Each image also gets responsive variants. On Cloudinary they are
+width-limited delivery transformations inserted after /upload/. Storages
+that can't transform (FileSystemStorage in dev/tests) serve the original
+for every variant and no srcset.
+"""
+from functools import lru_cache
+
+from django.core.files.storage import default_storage
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+# variant name -> max width in px; "full" is the original upload
+IMAGE_VARIANT_WIDTHS = {
+    "thumbnail": 320,
+    "medium": 768,
+}
+FULL_SRCSET_WIDTH = 1600  # width advertised for the original in srcset
+MEMO_SIZE = 8192
+
+_UPLOAD_SEGMENT = "/image/upload/"
+
+
+def _transform(url, width):
+    if _UPLOAD_SEGMENT not in url:
+        return None
+    return url.replace(_UPLOAD_SEGMENT, f"{_UPLOAD_SEGMENT}c_limit,w_{width},f_auto,q_auto/", 1)
+
+
+class ImageURLResolver:
+    """Memoized URL + variant resolution for names stored in `storage`."""
+
+    def __init__(self, storage=None, memo_size=MEMO_SIZE):
+        self._storage = storage
+        self.url = lru_cache(maxsize=memo_size)(self._url)
+        self.variants = lru_cache(maxsize=memo_size)(self._variants)
+
+    @property
+    def storage(self):
+        return self._storage if self._storage is not None else default_storage
+
+    def _url(self, name):
+        return self.storage.url(name) if name else None
+
+    def _variants(self, name):
+        """{'thumbnail', 'medium', 'full', 'srcset'} for a stored name, or None."""
+        full = self.url(name)
+        if full is None:
+            return None
+        variants = {}
+        srcset = []
+        for variant, width in IMAGE_VARIANT_WIDTHS.items():
+            url = _transform(full, width)
+            variants[variant] = url or full
+            if url:
+                srcset.append(f"{url} {width}w")
+        variants["full"] = full
+        variants["srcset"] = ", ".join(srcset + [f"{full} {FULL_SRCSET_WIDTH}w"]) if srcset else None
+        return variants
+
+    def clear(self):
+        self.url.cache_clear()
+        self.variants.cache_clear()
+
+
+resolver = ImageURLResolver()
+
+
+@receiver(setting_changed)
+def _clear_on_storage_change(setting, **kwargs):
+    if setting in {"STORAGES", "DEFAULT_FILE_STORAGE", "MEDIA_URL", "CLOUDINARY_STORAGE"}:
+        resolver.clear()
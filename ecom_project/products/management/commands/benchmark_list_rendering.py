@@ -0,0 +1,75 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from products.fastpath import FastJSONRenderer, product_list_row
+from products.models import Category, Product
+from products.serializers import ProductListSerializer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares ProductListSerializer + JSONRenderer with the fast values() + "
+        "orjson path on one page of products. Sample rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100)
+        parser.add_argument("--iterations", type=int, default=200)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options["rows"], options["iterations"])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, rows, iterations):
+        missing = rows - Product.objects.count()
+        if missing > 0:
+            category = Category.objects.create(name="benchmark-category")
+            Product.objects.bulk_create(
+                Product(
+                    name=f"Benchmark product {i}",
+                    description="benchmark",
+                    price=f"{1000 + i}.50",
+                    discount_price=f"{900 + i}.00" if i % 2 else None,
+                    category=category,
+                )
+                for i in range(missing)
+            )
+
+        queryset = Product.objects.with_main_image().order_by("id")
+        # Rows are fetched once up front: this measures serialization and rendering, not the DB.
+        instances = list(queryset[:rows])
+        values = list(queryset.values(*product_list_row.columns)[:rows])
+
+        def serializer_path():
+            return JSONRenderer().render(ProductListSerializer(instances, many=True).data)
+
+        def fast_path():
+            return FastJSONRenderer().render(product_list_row.build(values))
+
+        if serializer_path() != fast_path():
+            self.stderr.write(self.style.ERROR("Outputs differ, fast path is not byte-compatible."))
+            return
+
+        results = {}
+        for label, fn in (("serializer", serializer_path), ("fast path", fast_path)):
+            started = time.perf_counter()
+            for _ in range(iterations):
+                fn()
+            results[label] = (time.perf_counter() - started) / iterations * 1000
+
+        for label, ms in results.items():
+            self.stdout.write(f"{label:>10}: {ms:.3f} ms per {len(values)}-row page")
+        self.stdout.write(self.style.SUCCESS(
+            f"Outputs identical, fast path is {results['serializer'] / results['fast path']:.1f}x faster."
+        ))
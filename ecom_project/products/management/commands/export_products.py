@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from products.exports import CHUNK_SIZE, EXPORT_FORMATS, export_products, write_export
+
+
+class Command(BaseCommand):
+    help = "Streams every product with its variants as CSV (one row per variant) or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+        parser.add_argument("-o", "--output", help="File to write; defaults to stdout")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        chunks = export_products(options["format"], chunk_size=options["chunk_size"])
+        self.stdout.ending = ""  # chunks aren't lines
+        write_export(chunks, options["output"], self.stdout)
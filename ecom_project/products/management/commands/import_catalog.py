@@ -0,0 +1,284 @@
+import csv
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.utils import timezone
+
+from products.cache import CATALOG, category_namespace, deferred_invalidation, invalidate, product_namespace
+from products.home import rebuild_home_feed
+from products.models import Category, Product, ProductVariant
+
+PRODUCT_UPDATE_FIELDS = [
+    "description", "price", "discount_price", "category", "main_image", "updated_at",
+]
+MAX_REPORTED_ERRORS = 50
+
+
+def _read_csv(stream):
+    yield from csv.DictReader(stream)
+
+
+def _read_jsonl(stream):
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def _parsed(rows, path):
+    """Turns the reader's parse errors, and only those, into a CommandError."""
+    try:
+        yield from rows
+    except (ValueError, csv.Error) as e:
+        raise CommandError(f"Could not parse {path}: {e}")
+
+
+def _clean(model, field_name, value):
+    """
+    `value` converted and validated by the model field (max_digits,
+    decimal_places, integer range...), so the bulk write can't reject it.
+    Raises ValidationError. Extra decimal places are rounded.
+    """
+    field = model._meta.get_field(field_name)
+    value = field.to_python(value)
+    if value is None:
+        return None
+    if isinstance(field, models.DecimalField):
+        try:
+            value = value.quantize(Decimal(1).scaleb(-field.decimal_places))
+        except InvalidOperation:
+            raise ValidationError(f"Ensure that there are no more than {field.max_digits} digits in total.")
+    field.run_validators(value)
+    return value
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _max_length(model, field):
+    return model._meta.get_field(field).max_length
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams products from CSV or JSONL and upserts categories, products and "
+        "variants in batches. One row per variant, with columns: name, price, "
+        "description, discount_price, color, category, image, size, stock. "
+        "Products are matched on (name, color). image is a name already in the "
+        "media storage."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Input file, or - for stdin")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+        reader = _read_jsonl if fmt == "jsonl" else _read_csv
+
+        self.totals = dict.fromkeys(
+            ["rows", "errors", "categories", "products_created", "products_updated",
+             "variants_created", "variants_updated"], 0,
+        )
+        self.started = time.monotonic()
+
+        stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        try:
+            # Stock refreshes inside the batches must not purge the caches once per batch.
+            with deferred_invalidation():
+                rows = enumerate(_parsed(reader(stream), path), start=1)
+                for batch in _chunks(rows, options["batch_size"]):
+                    self.import_batch(batch)
+                    self.report_progress()
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        rebuild_home_feed()
+        self.stdout.write(self.style.SUCCESS("Import finished. " + self.summary()))
+
+    # ------------------------------------------------------------------ #
+
+    def validate_batch(self, batch):
+        """
+        Converts and checks a whole batch up front (no per-row full_clean()).
+        Returns the valid rows; errors are reported and counted.
+        """
+        name_max = _max_length(Product, "name")
+        color_max = _max_length(Product, "color")
+        category_max = _max_length(Category, "name")
+        size_max = _max_length(ProductVariant, "size")
+
+        valid = []
+        for line, raw in batch:
+            row = {key: (value.strip() if isinstance(value, str) else value) for key, value in raw.items()}
+            errors = []
+            name = row.get("name") or ""
+            color = row.get("color") or None
+            category = row.get("category") or None
+            size = row.get("size") or None
+            if not name:
+                errors.append("name is required")
+            elif len(name) > name_max:
+                errors.append(f"name is longer than {name_max} characters")
+            if color and len(color) > color_max:
+                errors.append(f"color is longer than {color_max} characters")
+            if category and len(category) > category_max:
+                errors.append(f"category is longer than {category_max} characters")
+            if size and len(size) > size_max:
+                errors.append(f"size is longer than {size_max} characters")
+            values = {}
+            for model, field in ((Product, "price"), (Product, "discount_price"), (ProductVariant, "stock")):
+                value = row.get(field)
+                try:
+                    values[field] = _clean(model, field, None if value in (None, "") else str(value))
+                except ValidationError as e:
+                    errors.append(f"{field}: {' '.join(e.messages)}")
+            price, discount = values.get("price"), values.get("discount_price")
+            stock = values.get("stock") or 0
+            if stock < 0:  # not every backend gives the field a range validator
+                errors.append("stock must not be negative")
+            if "price" in values and price is None:
+                errors.append("price is required")
+            elif price is not None and "discount_price" in values:
+                if price < 0 or (discount is not None and discount < 0):
+                    errors.append("prices must not be negative")
+                elif discount is not None and discount > price:
+                    errors.append("discount_price must not exceed price")
+
+            if errors:
+                self.report_error(line, "; ".join(errors))
+                continue
+            valid.append({
+                "name": name,
+                "color": color,
+                "description": row.get("description") or "",
+                "price": price,
+                "discount_price": discount,
+                "category": category,
+                "image": row.get("image") or None,
+                "size": size,
+                "stock": stock,
+            })
+        return valid
+
+    def import_batch(self, batch):
+        self.totals["rows"] += len(batch)
+        rows = self.validate_batch(batch)
+        if not rows:
+            return
+        with transaction.atomic():
+            categories = self.upsert_categories(rows)
+            products, category_ids = self.upsert_products(rows, categories)
+            self.upsert_variants(rows, products)
+            # held back by deferred_invalidation() and bumped once at the end
+            invalidate(
+                [CATALOG]
+                + [product_namespace(pk) for pk in products.values()]
+                + [category_namespace(pk) for pk in category_ids]
+            )
+
+    def upsert_categories(self, rows):
+        names = {row["category"] for row in rows if row["category"]}
+        existing = dict(Category.objects.filter(name__in=names).values_list("name", "id"))
+        missing = [Category(name=name) for name in names - existing.keys()]
+        if missing:
+            Category.objects.bulk_create(missing, ignore_conflicts=True)
+            existing.update(Category.objects.filter(name__in=[c.name for c in missing]).values_list("name", "id"))
+            self.totals["categories"] += len(missing)
+        return existing
+
+    def upsert_products(self, rows, categories):
+        """
+        Returns {(name, color): product id} and the ids of the categories
+        the products are in or were in before.
+        """
+        wanted = {}
+        for row in rows:  # later rows for the same product win
+            key = (row["name"], row["color"])
+            if not row["image"] and key in wanted:
+                row = {**row, "image": wanted[key]["image"]}
+            wanted[key] = row
+
+        existing = {
+            (p.name, p.color): p
+            for p in Product.objects.filter(name__in={name for name, _ in wanted}).only("id", "name", "color", "main_image", "category")
+        }
+        now = timezone.now()
+        to_create, to_update, category_ids = [], [], set()
+        for key, row in wanted.items():
+            product = existing.get(key) or Product(name=row["name"], color=row["color"])
+            category_ids.add(product.category_id)
+            product.description = row["description"]
+            product.price = row["price"]
+            product.discount_price = row["discount_price"]
+            product.category_id = categories.get(row["category"])
+            category_ids.add(product.category_id)
+            if row["image"]:
+                product.main_image = row["image"]
+            product.updated_at = now
+            (to_update if product.pk else to_create).append(product)
+
+        Product.objects.bulk_create(to_create)
+        Product.objects.bulk_update(to_update, PRODUCT_UPDATE_FIELDS)
+        self.totals["products_created"] += len(to_create)
+        self.totals["products_updated"] += len(to_update)
+        return {(p.name, p.color): p.pk for p in to_create + to_update}, category_ids - {None}
+
+    def upsert_variants(self, rows, products):
+        wanted = {}
+        for row in rows:
+            if row["size"]:
+                wanted[(products[(row["name"], row["color"])], row["size"])] = row["stock"]
+        if not wanted:
+            return
+        existing = {
+            (v.product_id, v.size): v
+            for v in ProductVariant.objects.filter(product_id__in={pid for pid, _ in wanted})
+        }
+        to_create, to_update = [], []
+        for (product_id, size), stock in wanted.items():
+            variant = existing.get((product_id, size))
+            if variant is None:
+                to_create.append(ProductVariant(product_id=product_id, size=size, stock=stock))
+            elif variant.stock != stock:
+                variant.stock = stock
+                to_update.append(variant)
+        # Both refresh Product.total_stock/in_stock for the touched products.
+        ProductVariant.objects.bulk_create(to_create)
+        ProductVariant.objects.bulk_update(to_update, ["stock"])
+        self.totals["variants_created"] += len(to_create)
+        self.totals["variants_updated"] += len(to_update)
+
+    # ------------------------------------------------------------------ #
+
+    def report_error(self, line, message):
+        self.totals["errors"] += 1
+        if self.totals["errors"] <= MAX_REPORTED_ERRORS:
+            self.stderr.write(f"row {line}: {message}")
+        elif self.totals["errors"] == MAX_REPORTED_ERRORS + 1:
+            self.stderr.write("further row errors are counted but not shown")
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        t = self.totals
+        return (
+            f"{t['rows']} rows ({t['rows'] / elapsed:.0f}/s), {t['errors']} rejected; "
+            f"categories +{t['categories']}; "
+            f"products +{t['products_created']} ~{t['products_updated']}; "
+            f"variants +{t['variants_created']} ~{t['variants_updated']}"
+        )
+
+    def report_progress(self):
+        self.stdout.write(self.summary())
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products.home import rebuild_home_feed
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the precomputed /api/products/home/ snapshot."
+
+    def handle(self, *args, **options):
+        payload = rebuild_home_feed()
+        self.stdout.write(self.style.SUCCESS(f"Home feed rebuilt ({len(payload)} bytes)."))
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:16
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def install_search_schema(apps, schema_editor):
+    from products.search import install_search_schema
+    install_search_schema(schema_editor.connection)
+    if schema_editor.connection.vendor == "postgresql":
+        # Fire the trigger once for existing rows.
+        schema_editor.execute("UPDATE products_product SET name = name")
+
+
+def uninstall_search_schema(apps, schema_editor):
+    from products.search import uninstall_search_schema
+    uninstall_search_schema(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_remove_product_size_remove_product_stock_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(install_search_schema, uninstall_search_schema),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:17
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_stock_totals(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductVariant = apps.get_model('products', 'ProductVariant')
+    variants = ProductVariant.objects.filter(product=OuterRef('pk'))
+    total = variants.order_by().values('product').annotate(total=Sum('stock')).values('total')
+    Product.objects.update(
+        total_stock=Coalesce(Subquery(total), 0),
+        in_stock=Exists(variants.filter(stock__gt=0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='in_stock',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='total_stock',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['in_stock', 'id'], name='product_in_stock_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['in_stock', '-sold', 'id'], name='product_in_stock_sold_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['in_stock', '-created_at', 'id'], name='product_in_stock_new_idx'),
+        ),
+        migrations.RunPython(backfill_stock_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:24
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Case, F, Q, Value, When
+
+
+def backfill_pricing(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    discounted = Q(discount_price__gt=0)
+    Product.objects.update(
+        effective_price=Case(
+            When(discounted, then=F('discount_price')),
+            default=F('price'),
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        ),
+        discount_percent=Case(
+            When(
+                discounted & Q(discount_price__lt=F('price')),
+                then=(F('price') - F('discount_price')) * Value(100) / F('price'),
+            ),
+            default=Value(Decimal('0')),
+            output_field=models.DecimalField(max_digits=5, decimal_places=2),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_product_stock_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='discount_percent',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=5),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['effective_price', 'id'], name='product_effective_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['discount_percent', 'id'], name='product_discount_percent_idx'),
+        ),
+        migrations.RunPython(backfill_pricing, migrations.RunPython.noop),
+    ]
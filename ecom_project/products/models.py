@@ -1,10 +1,16 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
-from decimal import Decimal
+from django.db.models import Case, Exists, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, NullIf
+from django.db.models.lookups import GreaterThan, LessThan
+from decimal import Decimal, ROUND_HALF_UP
 from django.utils import timezone
 from datetime import timedelta
 import re
 from django.core.exceptions import ValidationError
 
+from .tracking import TrackedFieldsMixin
+
 # Utility to clean names for file paths
 def clean_name(name):
     # Replace spaces with underscores and remove invalid characters
@@ -37,7 +43,100 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
-class Product(models.Model):
+PRICING_FIELDS = ('effective_price', 'discount_percent')
+STOCK_FIELDS = {'total_stock', 'in_stock'}  # written by Product.refresh_stock()
+
+
+def _price_expression(value):
+    if hasattr(value, 'resolve_expression'):
+        return value
+    return Value(value, output_field=models.DecimalField(max_digits=10, decimal_places=2))
+
+
+def pricing_expressions(price=F('price'), discount_price=F('discount_price')):
+    """
+    SQL equivalents of Product.update_pricing(), for UPDATE statements.
+    price / discount_price are the new values: expressions or literals.
+    """
+    price, discount_price = _price_expression(price), _price_expression(discount_price)
+    discounted = GreaterThan(discount_price, 0)
+    return {
+        'effective_price': Case(
+            When(discounted, then=discount_price),
+            default=price,
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        ),
+        'discount_percent': Case(
+            When(
+                discounted & LessThan(discount_price, price),
+                then=(price - discount_price) * Value(100) / price,
+            ),
+            default=Value(Decimal('0')),
+            output_field=models.DecimalField(max_digits=5, decimal_places=2),
+        ),
+    }
+
+
+class ProductQuerySet(models.QuerySet):
+    """
+    Bulk writes bypass Product.save(), so they keep the pricing columns in
+    sync and invalidate the cached responses themselves. bulk_update() goes
+    through update().
+    """
+
+    def update(self, **kwargs):
+        if {'price', 'discount_price'} & kwargs.keys():
+            kwargs.update(pricing_expressions(
+                kwargs.get('price', F('price')),
+                kwargs.get('discount_price', F('discount_price')),
+            ))
+        if not kwargs.keys() - STOCK_FIELDS:
+            # Product.refresh_stock(), whose caller (stock_changed) invalidates
+            return super().update(**kwargs)
+        rows = list(self.values_list('pk', 'category_id'))
+        updated = super().update(**kwargs)
+        category_ids = {category_id for _, category_id in rows}
+        new_category = kwargs.get('category_id', kwargs.get('category'))
+        if new_category is not None:
+            category_ids.add(getattr(new_category, 'pk', new_category))
+        products_changed({pk for pk, _ in rows}, category_ids)
+        return updated
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.update_pricing()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if {'price', 'discount_price'} & set(fields):
+            objs = list(objs)
+            for obj in objs:
+                obj.update_pricing()
+            fields = list(dict.fromkeys([*fields, *PRICING_FIELDS]))
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def with_main_image(self):
+        """
+        Annotates main_image_name: the stored name of main_image, falling back
+        to the product's main ProductImage, resolved in the same query.
+        """
+        gallery_main = (
+            ProductImage.objects
+            .filter(product=OuterRef('pk'), is_main=True)
+            .values('image')[:1]
+        )
+        as_text = models.CharField()
+        return self.annotate(
+            main_image_name=Coalesce(
+                NullIf('main_image', Value(''), output_field=as_text),
+                Subquery(gallery_main),
+                output_field=as_text,
+            )
+        )
+
+
+class Product(TrackedFieldsMixin, models.Model):
     name = models.CharField(max_length=255, db_index=True)  # Add db_index for search/filter
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -55,61 +154,193 @@ class Product(models.Model):
     discount_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     sold = models.PositiveIntegerField(default=0, db_index=True)  # Add db_index for best-seller queries
     main_image = models.ImageField(upload_to=upload_to, blank=True, null=True)  # New main image field
+    # Maintained by a database trigger on PostgreSQL, unused elsewhere (see products/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Denormalized from the variants by refresh_stock(), so the in_stock
+    # filter doesn't need a join + DISTINCT. Units held by pending orders
+    # (ProductVariant.reserved) don't count.
+    total_stock = models.PositiveIntegerField(default=0, editable=False)
+    in_stock = models.BooleanField(default=False, editable=False)
+    # What the customer pays (discount_price when set, as orders charge it)
+    # and the percentage off, kept in sync by update_pricing()
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    discount_percent = models.DecimalField(max_digits=5, decimal_places=2, default=0, editable=False)
+
+    objects = ProductQuerySet.as_manager()
+    # a move between categories invalidates both (products/signal.py)
+    tracked_fields = ('category_id',)
+
+    class Meta:
+        indexes = [
+            # in_stock filter combined with each listing's sort key
+            models.Index(fields=['in_stock', 'id'], name='product_in_stock_id_idx'),
+            models.Index(fields=['in_stock', '-sold', 'id'], name='product_in_stock_sold_idx'),
+            models.Index(fields=['in_stock', '-created_at', 'id'], name='product_in_stock_new_idx'),
+            # "cheapest first" / price range filters and "biggest deals"
+            models.Index(fields=['effective_price', 'id'], name='product_effective_price_idx'),
+            models.Index(fields=['discount_percent', 'id'], name='product_discount_percent_idx'),
+        ]
 
     @property
     def is_new(self):
         days = 7
         return self.created_at >= timezone.now() - timedelta(days=days)
 
+    @property
+    def has_discount(self):
+        return self.discount_price is not None and self.discount_price > 0
+
     def get_discounted_price(self):
+        """The amount taken off the price (the price paid is effective_price)."""
         if self.discount_price:
             return max(self.price - self.discount_price, Decimal('0.00'))
 
+    def update_pricing(self):
+        """Recomputes effective_price and discount_percent from price / discount_price."""
+        # unsaved instances may still hold ints/floats/strings
+        price = self._meta.get_field('price').to_python(self.price)
+        discount_price = self._meta.get_field('discount_price').to_python(self.discount_price)
+        discounted = discount_price is not None and discount_price > 0
+        self.effective_price = discount_price if discounted else price
+        if discounted and discount_price < price:
+            percent = (price - discount_price) * 100 / price
+            self.discount_percent = percent.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        else:
+            self.discount_percent = Decimal('0')
+
     def __str__(self):
         return self.name
 
     def save(self, *args, **kwargs):
         self.full_clean()  # Enforce clean() on save
+        self.update_pricing()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'price', 'discount_price'} & set(update_fields):
+            kwargs['update_fields'] = list(dict.fromkeys([*update_fields, *PRICING_FIELDS]))
         super().save(*args, **kwargs)
 
     @classmethod
-    def bulk_update_stock(cls, product_quantity_list):
+    def refresh_stock(cls, product_ids):
+        """
+        Recomputes total_stock / in_stock from the available (unreserved)
+        stock of the variants of the given products, in a single UPDATE.
+        """
+        variants = ProductVariant.objects.filter(product=OuterRef('pk'))
+        total = (
+            variants.order_by().values('product')
+            .annotate(total=Sum(F('stock') - F('reserved')))
+            .values('total')
+        )
+        return cls.objects.filter(pk__in=list(product_ids)).update(
+            total_stock=Coalesce(Subquery(total), 0),
+            in_stock=Exists(variants.filter(stock__gt=F('reserved'))),
+        )
+
+    @classmethod
+    def bulk_update_stock(cls, variant_quantity_list, allow_partial=True):
         """
-        Efficiently update stock for multiple products.
-        product_quantity_list: list of (product_id, quantity_to_subtract)
+        Efficiently update stock for multiple variants (stock lives on
+        ProductVariant). variant_quantity_list: list of (variant_id, quantity_to_subtract)
+        Returns a products.stock.StockResult; lines without enough stock are skipped.
         """
-        products = cls.objects.filter(id__in=[pid for pid, _ in product_quantity_list])
-        product_map = {p.id: p for p in products}
-        for pid, qty in product_quantity_list:
-            if pid in product_map:
-                product_map[pid].stock = max(product_map[pid].stock - qty, 0)
-        cls.objects.bulk_update(products, ['stock'])
-
-class ProductImage(models.Model):
+        from .stock import decrement_stock
+        return decrement_stock(variant_quantity_list, allow_partial=allow_partial)
+
+class ProductImage(TrackedFieldsMixin, models.Model):
     product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE)
     image = models.ImageField(upload_to=upload_to)
     is_main = models.BooleanField(default=False, db_index=True)
 
+    tracked_fields = ('product_id', 'is_main')
+
     def save(self, *args, **kwargs):
-        # If this is the first image for the product, set as main if none exists
-        if not self.product.images.exclude(pk=self.pk).filter(is_main=True).exists():
-            self.is_main = True
-        elif self.is_main:
-            # If this is set as main, unset others
-            ProductImage.objects.filter(product=self.product, is_main=True).exclude(pk=self.pk).update(is_main=False)
+        # Only a new image, a change of product or of is_main can break
+        # "one main image per product"; re-saving an unchanged image costs
+        # no extra query.
+        if self.is_main:
+            if self.has_changed('is_main') or self.has_changed('product_id'):
+                # If this is set as main, unset others
+                ProductImage.objects.filter(product_id=self.product_id, is_main=True).exclude(pk=self.pk).update(is_main=False)
+        elif self.changed_fields():
+            # If this is the first image for the product, set as main if none exists
+            if not ProductImage.objects.filter(product_id=self.product_id, is_main=True).exclude(pk=self.pk).exists():
+                self.is_main = True
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Image for {self.product.name}"
 
+class ProductVariantQuerySet(models.QuerySet):
+    """
+    Bulk writes skip the post_save signal that keeps Product.total_stock in
+    sync, so they refresh it themselves. bulk_update() goes through update().
+    """
+
+    def update(self, **kwargs):
+        if not {'stock', 'reserved', 'product', 'product_id'} & kwargs.keys():
+            return super().update(**kwargs)
+        product_ids = set(self.values_list('product_id', flat=True))
+        rows = super().update(**kwargs)
+        new_product = kwargs.get('product_id', kwargs.get('product'))
+        if new_product is not None:
+            product_ids.add(getattr(new_product, 'pk', new_product))
+        stock_changed(product_ids)
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        created = super().bulk_create(objs, *args, **kwargs)
+        stock_changed({obj.product_id for obj in objs})
+        return created
+
+
+def stock_changed(product_ids):
+    """Refreshes the stock columns and cached responses of the given products."""
+    if not product_ids:
+        return
+    Product.refresh_stock(product_ids)
+    products_changed(product_ids)
+
+
+def products_changed(product_ids, category_ids=None):
+    """
+    Invalidates the cached responses of the given products: the catalog,
+    their pages and their categories (read from the table unless the
+    caller already knows them).
+    """
+    from .cache import CATALOG, category_namespace, product_namespace, invalidate
+
+    if not product_ids:
+        return
+    # ?category= lists are keyed on their category alone (category_filtered_namespaces)
+    if category_ids is None:
+        category_ids = set(
+            Product.objects.filter(pk__in=list(product_ids), category__isnull=False)
+            .values_list('category_id', flat=True)
+        )
+    invalidate(
+        [CATALOG]
+        + [product_namespace(pk) for pk in product_ids]
+        + [category_namespace(pk) for pk in category_ids - {None}]
+    )
+
+
 class ProductVariant(models.Model):
     product = models.ForeignKey(Product, related_name='variants', on_delete=models.CASCADE)
     size = models.CharField(max_length=50, db_index=True)
     stock = models.PositiveIntegerField(default=0, db_index=True)
+    # Units held by pending orders (orders.StockReservation), maintained by
+    # products/stock.py. Only stock - reserved can be sold.
+    reserved = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ProductVariantQuerySet.as_manager()
 
     class Meta:
         unique_together = ('product', 'size')
 
+    @property
+    def available(self):
+        return max(self.stock - self.reserved, 0)
+
     def __str__(self):
         return f"{self.product.name} - Size {self.size}"
 
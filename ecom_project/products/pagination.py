@@ -1,6 +1,134 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
 
 class ProductListPagination(PageNumberPagination):
     page_size = 12  # default page size
     page_size_query_param = 'page_size'  # allows frontend override
     max_page_size = 100
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _ordering_field(queryset, name):
+    """The model field (or annotation output field) a cursor value belongs to."""
+    try:
+        return queryset.model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return queryset.query.annotations[name].output_field
+
+
+class CursorOrPageNumberPagination(PageNumberPagination):
+    """
+    Page-number pagination with an opt-in keyset mode for infinite scroll.
+
+    Sending ?cursor= (empty for the first page) switches to keyset
+    pagination on the view's `cursor_ordering`, e.g. ('-sold', 'id'). Pages
+    are fetched with a WHERE on the last row's sort key instead of OFFSET,
+    and no COUNT(*) is run. The last ordering field must be unique.
+    """
+    cursor_query_param = 'cursor'
+    cursor_page_size = 20
+    invalid_cursor_message = 'Invalid cursor'
+
+    cursor_mode = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.cursor_mode = True
+        self.request = request
+        self.ordering = tuple(getattr(view, 'cursor_ordering', ('id',)))
+        page_size = self.get_page_size(request) or self.cursor_page_size
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request.query_params[self.cursor_query_param], queryset)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.next_position = self.position_of(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_cursor_link(),
+            'results': data,
+        })
+
+    def get_next_cursor_link(self):
+        if self.next_position is None:
+            return None
+        # page numbers don't apply to keyset pages
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def position_of(self, row):
+        fields = [f.lstrip('-') for f in self.ordering]
+        if isinstance(row, dict):
+            return [_encode_value(row[f]) for f in fields]
+        return [_encode_value(getattr(row, f)) for f in fields]
+
+    def after(self, position):
+        """
+        Rows strictly after `position` in self.ordering:
+        (a > x) OR (a = x AND b > y) OR ..., with < for descending fields.
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def encode_cursor(self, position):
+        raw = json.dumps(position, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, encoded, queryset):
+        """
+        The position in `encoded`, each value converted back with its
+        ordering field's to_python(). Raises NotFound for anything that
+        isn't a cursor of this ordering.
+        """
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            position = json.loads(raw)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            position = [
+                _ordering_field(queryset, field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return position
@@ -0,0 +1,168 @@
+"""
+Full-text product search.
+
+PostgreSQL: Product.search_vector is kept up to date by a trigger
+(name weighted A, description B) and has a GIN index. Results are
+ranked with ts_rank. A pg_trgm index on name adds typo tolerance.
+
+SQLite: an external-content FTS5 table kept in sync by triggers, ranked
+with bm25, so dev and test databases return the same kind of results.
+
+Both schemas are created by migration 0008. install_search_schema() runs
+again after every migrate, because SQLite drops a table's triggers when
+a migration rebuilds the table.
+"""
+import re
+
+from django.db import connections
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+
+NAME_WEIGHT, DESCRIPTION_WEIGHT = 10.0, 1.0  # bm25 column weights (SQLite)
+
+PRODUCT_TABLE = "products_product"
+FTS_TABLE = "products_product_fts"
+
+POSTGRES_SCHEMA = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE OR REPLACE FUNCTION products_product_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS products_product_search_vector_trigger ON products_product",
+    """
+    CREATE TRIGGER products_product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description ON products_product
+    FOR EACH ROW EXECUTE FUNCTION products_product_search_vector_update()
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS products_product_search_vector_gin
+    ON products_product USING gin (search_vector)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS products_product_name_trgm
+    ON products_product USING gin (name gin_trgm_ops)
+    """,
+]
+
+SQLITE_TRIGGERS = {
+    "products_product_fts_ai": """
+        CREATE TRIGGER IF NOT EXISTS products_product_fts_ai AFTER INSERT ON products_product BEGIN
+            INSERT INTO products_product_fts(rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END
+    """,
+    "products_product_fts_ad": """
+        CREATE TRIGGER IF NOT EXISTS products_product_fts_ad AFTER DELETE ON products_product BEGIN
+            INSERT INTO products_product_fts(products_product_fts, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+        END
+    """,
+    "products_product_fts_au": """
+        CREATE TRIGGER IF NOT EXISTS products_product_fts_au AFTER UPDATE OF name, description ON products_product BEGIN
+            INSERT INTO products_product_fts(products_product_fts, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO products_product_fts(rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END
+    """,
+}
+
+
+def install_search_schema(connection):
+    """Idempotently creates the search triggers/indexes for this backend."""
+    if PRODUCT_TABLE not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            for statement in POSTGRES_SCHEMA:
+                cursor.execute(statement)
+        elif connection.vendor == "sqlite":
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                f"name, description, content='{PRODUCT_TABLE}', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s",
+                [PRODUCT_TABLE],
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+            missing = [name for name in SQLITE_TRIGGERS if name not in existing]
+            for name in missing:
+                cursor.execute(SQLITE_TRIGGERS[name])
+            if missing:
+                # Rows written while the triggers were gone are not indexed.
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def uninstall_search_schema(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("DROP TRIGGER IF EXISTS products_product_search_vector_trigger ON products_product")
+            cursor.execute("DROP FUNCTION IF EXISTS products_product_search_vector_update()")
+            cursor.execute("DROP INDEX IF EXISTS products_product_search_vector_gin")
+            cursor.execute("DROP INDEX IF EXISTS products_product_name_trgm")
+        elif connection.vendor == "sqlite":
+            for name in SQLITE_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def ensure_search_schema(using="default", **kwargs):
+    """post_migrate receiver."""
+    install_search_schema(connections[using])
+
+
+def _fts5_query(term):
+    # Quote every token so user input can't inject FTS5 syntax; prefix-match the words.
+    tokens = re.findall(r"\w+", term)
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def search_products(queryset, term):
+    """
+    Filters and ranks a Product queryset by `term`, best match first.
+    Other filters already applied to the queryset are kept.
+    """
+    vendor = connections[queryset.db].vendor
+
+    if vendor == "postgresql":
+        from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+
+        query = SearchQuery(term, config="simple", search_type="websearch")
+        return (
+            queryset
+            .filter(Q(search_vector=query) | Q(name__trigram_similar=term))
+            .annotate(
+                search_rank=SearchRank(F("search_vector"), query),
+                name_similarity=TrigramSimilarity("name", term),
+            )
+            .order_by("-search_rank", "-name_similarity", "id")
+        )
+
+    if vendor == "sqlite":
+        match = _fts5_query(term)
+        if not match:
+            return queryset.none()
+        return (
+            queryset
+            .filter(id__in=RawSQL(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (match,)
+            ))
+            .annotate(search_rank=RawSQL(
+                # bm25 is lower-is-better; negate it so both backends sort descending
+                f"SELECT -bm25({FTS_TABLE}, {NAME_WEIGHT}, {DESCRIPTION_WEIGHT}) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND rowid = {PRODUCT_TABLE}.id",
+                (match,),
+            ))
+            .order_by("-search_rank", "id")
+        )
+
+    return queryset.filter(Q(name__icontains=term) | Q(description__icontains=term)).order_by("id")
@@ -1,54 +1,108 @@
+from django.db import models
 from rest_framework.serializers import ModelSerializer
 from rest_framework import serializers
+from .images import resolver
 from .models import Product, Category, ProductImage, ProductVariant
 
-class ProductImageSerializer(serializers.ModelSerializer):
+
+def main_image_name(obj):
+    """
+    Resolves a product's main image name without querying: uses the
+    main_image_name annotation from Product.objects.with_main_image(), or
+    else the prefetched images.
+    """
+    if hasattr(obj, 'main_image_name'):
+        return obj.main_image_name
+    if obj.main_image:
+        return obj.main_image.name
+    for image in obj.images.all():
+        if image.is_main and image.image:
+            return image.image.name
+    return None
+
+
+def main_image_url(obj):
+    return resolver.url(main_image_name(obj))
+
+
+class ResolvedImageField(serializers.ImageField):
+    """ImageField whose URL comes from the memoized resolver."""
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        url = resolver.url(value.name)
+        request = self.context.get('request', None)
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """thumbnail / medium / full URLs and a srcset for an image field."""
+
+    def to_representation(self, value):
+        return resolver.variants(value.name) if value else None
+
+
+class CatalogModelSerializer(ModelSerializer):
+    serializer_field_mapping = {
+        **ModelSerializer.serializer_field_mapping,
+        models.ImageField: ResolvedImageField,
+    }
+
+
+class ProductImageSerializer(CatalogModelSerializer):
+    image_variants = ImageVariantsField(source='image')
+
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'is_main']
+        fields = ['id', 'image', 'is_main', 'image_variants']
 
 class ProductVariantSerializer(serializers.ModelSerializer):
+    available = serializers.IntegerField(read_only=True)  # stock not held by pending orders
+
     class Meta:
         model = ProductVariant
-        fields = ['id', 'size', 'stock']
+        fields = ['id', 'size', 'stock', 'available']
 
-class ProductListSerializer(serializers.ModelSerializer):
+class ProductListSerializer(CatalogModelSerializer):
     main_image_url = serializers.SerializerMethodField()
+    main_image_variants = serializers.SerializerMethodField()
     class Meta:
         model = Product
         fields = [
-            'id', 'name', 'price', 'discount_price', 'main_image_url','category'
+            'id', 'name', 'price', 'discount_price', 'main_image_url', 'main_image_variants', 'category'
         ]
 
     def get_main_image_url(self, obj):
-        if obj.main_image:
-            return obj.main_image.url
-        main_img_obj = obj.images.filter(is_main=True).first()
-        if main_img_obj and main_img_obj.image:
-            return main_img_obj.image.url
-        return None
-
-class ProductDetailSerializer(serializers.ModelSerializer):
+        return main_image_url(obj)
+
+    def get_main_image_variants(self, obj):
+        return resolver.variants(main_image_name(obj))
+
+class ProductDetailSerializer(CatalogModelSerializer):
     images = ProductImageSerializer(many=True, read_only=True)
     main_image_url = serializers.SerializerMethodField()
+    main_image_variants = serializers.SerializerMethodField()
     variants = ProductVariantSerializer(many=True, read_only=True)
 
     class Meta:
         model = Product
-        fields = '__all__'  # or list all fields explicitly + 'images' + 'main_image_url' + 'variants'
+        exclude = ['search_vector']  # all fields + 'images' + 'main_image_url' + 'variants'
 
     def get_main_image_url(self, obj):
-        if obj.main_image:
-            return obj.main_image.url
-        main_img_obj = obj.images.filter(is_main=True).first()
-        if main_img_obj and main_img_obj.image:
-            return main_img_obj.image.url
-        return None
-
-class CategorySerializer(ModelSerializer):
+        return main_image_url(obj)
+
+    def get_main_image_variants(self, obj):
+        return resolver.variants(main_image_name(obj))
+
+class CategorySerializer(CatalogModelSerializer):
+    image_variants = ImageVariantsField(source='image')
+
     class Meta:
         model = Category
-        fields = ['id', 'name', 'description', 'image']  # Include image
+        fields = ['id', 'name', 'description', 'image', 'image_variants']  # Include image
         extra_kwargs = {
             'created_at': {'read_only': True},
             'updated_at': {'read_only': True},
@@ -1,3 +1,56 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import CATALOG, category_namespace, product_namespace, invalidate
+from .models import Product, ProductImage, ProductVariant, Category
+
+
+def _product_namespaces(product_id, category_id):
+    namespaces = [CATALOG, product_namespace(product_id)]
+    if category_id:
+        namespaces.append(category_namespace(category_id))
+    return namespaces
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    namespaces = _product_namespaces(instance.pk, instance.category_id)
+    if kwargs.get("created") is False:
+        # A product moving between categories must invalidate both of them;
+        # the previous one was recorded when the product was loaded.
+        previous = instance.initial_value("category_id")
+        if previous and previous != instance.category_id:
+            namespaces.append(category_namespace(previous))
+    invalidate(namespaces)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def invalidate_product_child(sender, instance, **kwargs):
+    if sender._meta.get_field("product").is_cached(instance):
+        category_id = instance.product.category_id
+    else:
+        category_id = (
+            Product.objects.filter(pk=instance.product_id).values_list("category_id", flat=True).first()
+        )
+    invalidate(_product_namespaces(instance.product_id, category_id))
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def refresh_product_stock(sender, instance, **kwargs):
+    Product.refresh_stock([instance.product_id])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    invalidate([CATALOG, category_namespace(instance.pk)])
+
+
 # # filepath: c:\Users\haroun\Desktop\pfd\ecom_project\Backend\ecom_project\products\signal.py
 # from django.db.models.signals import post_save
 # from django.dispatch import receiver
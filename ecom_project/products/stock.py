@@ -0,0 +1,238 @@
+"""
+Set-based stock service for product variants.
+
+decrement_stock() takes any number of (variant_id, quantity) lines and
+applies them in a constant number of statements, however many lines
+there are:
+
+1. one SELECT ... FOR UPDATE of the affected variants, which serializes
+   concurrent callers (e.g. two admins accepting orders that share a
+   variant) and tells us exactly which lines cannot be served;
+2. one UPDATE ... SET stock = CASE id WHEN .. THEN stock - qty .. END,
+   guarded by WHERE stock - reserved >= qty as well;
+3. one UPDATE of Product.sold, plus the total_stock / in_stock refresh.
+
+All of it runs in one transaction.
+
+Units held for pending orders are counted in ProductVariant.reserved;
+only stock - reserved is available. reserve_stock() / release_stock()
+move units in and out of that column with the same lock-then-CASE
+pattern, and apply_decrements() can consume held units (the order that
+holds them being accepted).
+"""
+from collections import defaultdict, namedtuple
+
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, When
+
+from .models import Product, ProductVariant
+
+
+class StockShortage(namedtuple("StockShortage", "variant_id label requested available")):
+    """A line that can't be served. available is None for unknown variants."""
+
+    def __str__(self):
+        if self.available is None:
+            return f"Variant #{self.variant_id} does not exist."
+        return (
+            f"Not enough stock for “{self.label}” – "
+            f"requested {self.requested}, available {self.available}."
+        )
+
+
+# applied: {variant_id: quantity} actually decremented
+# shortages: [StockShortage], empty when every line was applied
+StockResult = namedtuple("StockResult", "applied shortages")
+
+
+class StockConflict(Exception):
+    """The guarded UPDATE touched fewer rows than the locked read allowed."""
+
+
+def merge_lines(lines):
+    """Sums the quantities of lines that share a variant."""
+    merged = defaultdict(int)
+    for variant_id, quantity in lines:
+        if variant_id is not None and quantity:
+            merged[variant_id] += quantity
+    return dict(merged)
+
+
+VARIANT_ROW_FIELDS = ("id", "stock", "reserved", "size", "product_id", "product__name", "product__effective_price")
+
+
+def lock_variants(variant_ids):
+    """
+    SELECT ... FOR UPDATE of the given variants, in one query.
+    Returns {variant_id: {"id", "stock", "reserved", "size", "product_id",
+    "product__name", "product__effective_price"}}.
+    """
+    return {
+        row["id"]: row
+        for row in ProductVariant.objects
+        .select_for_update(of=("self",))
+        .filter(pk__in=variant_ids)
+        .values(*VARIANT_ROW_FIELDS)
+    }
+
+
+def check_lines(lines, held=None):
+    """
+    Unlocked pre-check of (variant_id, quantity) lines, for form
+    validation: the StockShortage list under the same rule as the locked
+    writes (stock - reserved, plus what the caller holds itself, `held`
+    as {variant_id: quantity}). The locked write still has the last word.
+    """
+    requested = merge_lines(lines)
+    held = held or {}
+    rows = {
+        row["id"]: row
+        for row in ProductVariant.objects.filter(pk__in=requested).values(*VARIANT_ROW_FIELDS)
+    }
+    return [
+        s for s in (
+            shortage(variant_id, quantity, rows.get(variant_id), min(held.get(variant_id, 0), quantity))
+            for variant_id, quantity in requested.items()
+        ) if s
+    ]
+
+
+def shortage(variant_id, requested, row, held=0):
+    """
+    The StockShortage for `requested` units of a locked row, or None if
+    they fit. `held` units reserved by the caller itself are available to it.
+    """
+    if row is None:
+        return StockShortage(variant_id, None, requested, None)
+    available = row["stock"] - row["reserved"] + held
+    if available < requested:
+        label = f"{row['product__name']} - Size {row['size']}"
+        return StockShortage(variant_id, label, requested, max(available, 0))
+    return None
+
+
+def _case(column, deltas):
+    """column = CASE id WHEN <id> THEN column + <delta> ... ELSE column END"""
+    return Case(
+        *(When(pk=pk, then=F(column) + delta) for pk, delta in deltas.items()),
+        default=F(column),
+        output_field=PositiveIntegerField(),
+    )
+
+
+def _guarded_update(guard, expected, **columns):
+    updated = ProductVariant.objects.filter(guard).update(**columns)
+    if updated != expected:
+        # Only possible without row locks (SQLite): roll everything back.
+        raise StockConflict(f"expected to update {expected} variants, updated {updated}")
+
+
+def apply_decrements(applied, rows, update_sold=True, released=None):
+    """
+    Writes {variant_id: quantity} (already checked against the locked
+    `rows`) with one guarded UPDATE, and the matching sold counters with
+    another. `released` ({variant_id: quantity}, <= applied) is the part
+    that was reserved by the caller and comes off `reserved` as well.
+    Must run inside the transaction that locked the rows.
+    """
+    released = released or {}
+    guard = Q()
+    for variant_id, quantity in applied.items():
+        held = released.get(variant_id, 0)
+        guard |= Q(pk=variant_id, stock__gte=F("reserved") + (quantity - held), reserved__gte=held)
+    columns = {"stock": _case("stock", {pk: -quantity for pk, quantity in applied.items()})}
+    if released:
+        columns["reserved"] = _case("reserved", {pk: -quantity for pk, quantity in released.items()})
+    _guarded_update(guard, len(applied), **columns)
+
+    if update_sold:
+        sold = defaultdict(int)
+        for variant_id, quantity in applied.items():
+            sold[rows[variant_id]["product_id"]] += quantity
+        Product.objects.filter(pk__in=sold).update(sold=_case("sold", sold))
+
+
+def decrement_stock(lines, allow_partial=False, update_sold=True):
+    """
+    Takes `quantity` units off each variant in `lines` ((variant_id,
+    quantity) pairs; repeated variants are merged) and adds them to the
+    product's `sold` counter.
+
+    By default it's all or nothing: if any line is short, nothing is
+    written and the shortages are returned. With allow_partial=True the
+    lines that fit are applied and only the others are reported.
+    """
+    requested = merge_lines(lines)
+    if not requested:
+        return StockResult({}, [])
+
+    with transaction.atomic():
+        rows = lock_variants(requested)
+        applied, shortages = {}, []
+        for variant_id, quantity in requested.items():
+            short = shortage(variant_id, quantity, rows.get(variant_id))
+            if short:
+                shortages.append(short)
+            else:
+                applied[variant_id] = quantity
+
+        if not applied or (shortages and not allow_partial):
+            return StockResult({}, shortages)
+        apply_decrements(applied, rows, update_sold)
+
+    return StockResult(applied, shortages)
+
+
+def reserve_stock(lines):
+    """
+    Holds `quantity` available units of each variant in `lines`, all or
+    nothing. Returns a StockResult; nothing is reserved when there are
+    shortages.
+    """
+    requested = merge_lines(lines)
+    if not requested:
+        return StockResult({}, [])
+
+    with transaction.atomic():
+        rows = lock_variants(requested)
+        shortages = [
+            s for s in (
+                shortage(variant_id, quantity, rows.get(variant_id))
+                for variant_id, quantity in requested.items()
+            ) if s
+        ]
+        if shortages:
+            return StockResult({}, shortages)
+        apply_reservations(requested)
+
+    return StockResult(requested, [])
+
+
+def apply_reservations(requested):
+    """
+    Adds {variant_id: quantity} (already checked against locked rows) to
+    `reserved` with one guarded UPDATE.
+    """
+    guard = Q()
+    for variant_id, quantity in requested.items():
+        guard |= Q(pk=variant_id, stock__gte=F("reserved") + quantity)
+    _guarded_update(guard, len(requested), reserved=_case("reserved", requested))
+
+
+def release_stock(lines):
+    """Gives reserved units back, e.g. for rejected or expired holds."""
+    requested = merge_lines(lines)
+    if not requested:
+        return
+    with transaction.atomic():
+        rows = lock_variants(requested)
+        # Never below zero, whatever the caller thinks was held.
+        released = {
+            variant_id: min(quantity, rows[variant_id]["reserved"])
+            for variant_id, quantity in requested.items()
+            if variant_id in rows and rows[variant_id]["reserved"]
+        }
+        if released:
+            ProductVariant.objects.filter(pk__in=released).update(
+                reserved=_case("reserved", {pk: -quantity for pk, quantity in released.items()})
+            )
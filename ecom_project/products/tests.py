@@ -1,3 +1,574 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.files.storage import FileSystemStorage
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from orders.models import Order, OrderItem
+
+from . import cache as catalog_cache
+from .fastpath import FastJSONRenderer, product_list_row
+from .images import ImageURLResolver
+from .models import Category, Product, ProductImage, ProductVariant
+from .pagination import CursorOrPageNumberPagination
+from .search import search_products
+from .serializers import ProductListSerializer
+from .stock import decrement_stock, reserve_stock
+
+
+class FastListPathTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Shoes")
+        for i in range(5):
+            Product.objects.create(
+                name=f"Product {i}   é \"quoted\"",
+                description="description",
+                price=f"{i}.5",
+                discount_price=i if i % 2 else None,
+                category=category if i % 2 else None,
+            )
+
+    def test_fast_path_is_byte_compatible_with_serializer(self):
+        queryset = Product.objects.with_main_image().order_by("id")
+        expected = JSONRenderer().render(ProductListSerializer(queryset, many=True).data)
+        rows = product_list_row.build(queryset.values(*product_list_row.columns))
+        self.assertEqual(FastJSONRenderer().render(rows), expected)
+
+    def test_list_endpoint_uses_constant_queries(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/products/list")
+        self.assertEqual(len(response.json()), 5)
+
+
+class PricingColumnsTests(TestCase):
+    def assertPricing(self, product, effective_price, discount_percent):
+        product.refresh_from_db()
+        self.assertEqual(product.effective_price, Decimal(effective_price))
+        self.assertEqual(product.discount_percent, Decimal(discount_percent))
+
+    def test_save_and_bulk_writes_keep_pricing_in_sync(self):
+        product = Product.objects.create(name="P", description="d", price=200, discount_price=150)
+        self.assertPricing(product, "150", "25")
+
+        Product.objects.filter(pk=product.pk).update(discount_price=None)
+        self.assertPricing(product, "200", "0")
+
+        product.discount_price = Decimal("50")
+        Product.objects.bulk_update([product], ["discount_price"])
+        self.assertPricing(product, "50", "75")
+
+        Product.objects.filter(pk=product.pk).update(price=F("price") / 2, discount_price=0)
+        self.assertPricing(product, "100", "0")
+
+    def test_order_lines_and_admin_use_the_price_paid(self):
+        product = Product.objects.create(name="Sale", description="d", price=100, discount_price=40)
+        self.assertEqual(product.get_discounted_price(), Decimal("60"))
+        variant = ProductVariant.objects.create(product=product, size="42", stock=5)
+        order = Order.objects.create(costumer_name="c", costumer_phone="+213555123456", wilaya="Alger")
+        item = OrderItem.objects.create(order=order, product_variant=variant, quantity=2)
+        order.bulk_add_items([{"product_variant": variant, "quantity": 2}])
+        self.assertEqual(set(order.items.values_list("price", flat=True)), {item.price})
+        self.assertEqual(item.price, 2 * product.effective_price)
+
+        model_admin = admin.site._registry[Product]
+        self.assertIn("effective_price", model_admin.get_fields(None, product))
+        self.assertNotIn("get_discounted_price", model_admin.get_fields(None, product))
+
+    def test_price_filters_use_the_price_paid(self):
+        Product.objects.create(name="Sale", description="d", price=100, discount_price=40)
+        Product.objects.create(name="Full", description="d", price=60)
+        response = self.client.get("/api/products/list", {"price_max": 50, "ordering": "effective_price"})
+        self.assertEqual([p["name"] for p in response.json()], ["Sale"])
+
+    def test_uncached_detail_reads_no_deferred_columns(self):
+        catalog_cache.local_cache.clear()
+        self.addCleanup(catalog_cache.local_cache.clear)
+        product = Product.objects.create(name="Sale", description="d", price=100, discount_price=40)
+        ProductVariant.objects.create(product=product, size="42", stock=1)
+        # product + category, images, variants
+        with self.assertNumQueries(3):
+            data = self.client.get(f"/api/products/{product.pk}/").json()
+        self.assertEqual((data["effective_price"], data["discount_percent"]), ("40.00", "60.00"))
+
+
+class TrackedSaveTests(TestCase):
+    def setUp(self):
+        self.shoes, self.bags = Category.objects.create(name="Shoes"), Category.objects.create(name="Bags")
+        product = Product.objects.create(name="Shoe", description="d", price=100, category=self.shoes)
+        ProductImage.objects.bulk_create([
+            ProductImage(product=product, image="a.jpg", is_main=True),
+            ProductImage(product=product, image="b.jpg"),
+        ])
+
+    def test_product_save_reads_nothing_back(self):
+        product = Product.objects.get()
+        product.name = "Boot"
+        with self.assertNumQueries(1):
+            product.save()
+
+    def test_category_change_is_checked_and_remembered(self):
+        product = Product.objects.get()
+        product.category = self.bags
+        with self.assertNumQueries(2):  # the new category exists, UPDATE
+            product.save()
+        self.assertEqual(product.initial_value("category_id"), self.bags.pk)
+        self.assertFalse(product.changed_fields())
+
+    def test_image_main_flag(self):
+        # with the product at hand the cache invalidation needs no lookup either
+        image = ProductImage.objects.select_related("product").get(image="b.jpg")
+        with self.assertNumQueries(1):
+            image.save()
+        image.is_main = True
+        image.save()
+        self.assertEqual(list(ProductImage.objects.filter(is_main=True).values_list("image", flat=True)), ["b.jpg"])
+
+
+class _CountingStorage(FileSystemStorage):
+    calls = 0
+
+    def url(self, name):
+        self.calls += 1
+        return super().url(name)
+
+
+class ImageURLResolverTests(SimpleTestCase):
+    def test_filesystem_storage_serves_original_for_every_variant(self):
+        resolver = ImageURLResolver(FileSystemStorage(base_url="/media/"))
+        variants = resolver.variants("products/shoe/a.jpg")
+        self.assertEqual(variants["thumbnail"], "/media/products/shoe/a.jpg")
+        self.assertEqual(variants["full"], "/media/products/shoe/a.jpg")
+        self.assertIsNone(variants["srcset"])
+        self.assertIsNone(resolver.variants(None))
+
+    def test_urls_are_memoized_per_name(self):
+        storage = _CountingStorage(base_url="/media/")
+        resolver = ImageURLResolver(storage)
+        for _ in range(3):
+            resolver.url("a.jpg")
+            resolver.variants("a.jpg")
+        self.assertEqual(storage.calls, 1)
+
+    def test_cloudinary_urls_get_width_transformations(self):
+        storage = FileSystemStorage(base_url="https://res.cloudinary.com/demo/image/upload/v1/media/")
+        variants = ImageURLResolver(storage).variants("a.jpg")
+        self.assertEqual(
+            variants["thumbnail"],
+            "https://res.cloudinary.com/demo/image/upload/c_limit,w_320,f_auto,q_auto/v1/media/a.jpg",
+        )
+        self.assertIn(" 768w", variants["srcset"])
+
+
+class _DeadCache:
+    """What django-redis with IGNORE_EXCEPTIONS looks like while Redis is down."""
+
+    def get(self, key, default=None):
+        return default
+
+    def get_many(self, keys):
+        return {}
+
+    def add(self, *args, **kwargs):
+        return None
+
+    def set(self, *args, **kwargs):
+        pass
+
+    set_many = delete = set
+
+
+class CacheOutageTests(TestCase):
+    def setUp(self):
+        catalog_cache.local_cache.clear()
+        patcher = mock.patch.object(catalog_cache, "cache", _DeadCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(catalog_cache.local_cache.clear)
+
+    def test_versions_fall_back_to_fresh_ones(self):
+        versions = catalog_cache.get_versions([catalog_cache.CATALOG, "category:1"])
+        self.assertEqual(len(versions), 2)
+        self.assertTrue(all(isinstance(v, int) for v in versions))
+
+    def test_catalog_endpoints_are_served_without_the_cache(self):
+        Product.objects.create(name="Shoe", description="d", price=100)
+        started = time.monotonic()
+        response = self.client.get("/api/products/list")
+        self.assertEqual(response.status_code, 200)
+        # computed right away, not after waiting LOCK_WAIT for a lock holder
+        self.assertLess(time.monotonic() - started, catalog_cache.LOCK_WAIT)
+
+
+class CacheLifetimeTests(SimpleTestCase):
+    def test_per_process_cache_keeps_short_ttls(self):
+        from . import views
+
+        self.assertFalse(catalog_cache.shared_cache())  # LocMemCache in tests
+        self.assertEqual((views.CATALOG_TTL, views.DETAIL_TTL), (300, 300))
+        self.assertEqual(catalog_cache._version_timeout(), catalog_cache.DEFAULT_TTL)
+
+
+class StockInvalidationTests(TestCase):
+    def setUp(self):
+        catalog_cache.local_cache.clear()
+        self.addCleanup(catalog_cache.local_cache.clear)
+        self.category = Category.objects.create(name="Shoes")
+        product = Product.objects.create(name="Shoe", description="d", price=100, category=self.category)
+        self.variant = ProductVariant.objects.create(product=product, size="42", stock=2)
+        # TestCase never commits: drop the bumps queued by the setup above
+        catalog_cache._flush_pending()
+
+    def names(self, **params):
+        response = self.client.get("/api/products/list", {"in_stock": "true", **params})
+        data = response.json()
+        return [p["name"] for p in (data["results"] if isinstance(data, dict) else data)]
+
+    def test_category_lists_follow_stock_changes(self):
+        self.assertEqual(self.names(category=self.category.pk), ["Shoe"])
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_stock([(self.variant.pk, 2)])
+        self.assertEqual(self.names(), [])
+        self.assertEqual(self.names(category=self.category.pk), [])
+
+
+class ImportCatalogTests(TestCase):
+    def setUp(self):
+        catalog_cache.local_cache.clear()
+        self.addCleanup(catalog_cache.local_cache.clear)
+
+    def run_import(self, price):
+        path = os.path.join(tempfile.mkdtemp(), "catalog.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("name,price,description,category,size,stock\n")
+            f.write(f"Shoe,{price},d,Shoes,41,3\nShoe,{price},d,Shoes,42,0\nBad,abc,d,Shoes,41,1\n")
+        call_command("import_catalog", path, stdout=StringIO(), stderr=StringIO())
+
+    def test_import_and_reimport_refresh_cached_pages(self):
+        self.run_import("100.00")
+        product = Product.objects.get()
+        self.assertEqual((product.total_stock, product.category.name), (3, "Shoes"))
+        self.assertEqual(ProductVariant.objects.count(), 2)
+
+        detail = f"/api/products/{product.pk}/"
+        listing = f"/api/products/list?category={product.category_id}"
+        self.assertEqual(self.client.get(detail).json()["price"], "100.00")
+        self.assertEqual(self.client.get(listing).json()[0]["price"], "100.00")
+
+        self.run_import("50.00")
+        self.assertEqual(self.client.get(detail).json()["price"], "50.00")
+        self.assertEqual(self.client.get(listing).json()[0]["price"], "50.00")
+
+    def test_rows_the_columns_cannot_hold_are_reported_one_by_one(self):
+        path = os.path.join(tempfile.mkdtemp(), "catalog.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for row in (
+                {"name": "Huge", "price": "1e20", "size": "41"},
+                {"name": "NaN", "price": "NaN", "size": "41"},
+                {"name": "Cheap", "price": "10", "discount_price": "12", "size": "41"},
+                {"name": "Overstock", "price": "10", "size": "41", "stock": "-1"},
+                {"name": "Fine", "price": "10.006", "size": "41", "stock": "2"},
+            ):
+                f.write(json.dumps(row) + "\n")
+        stderr = StringIO()
+        call_command("import_catalog", path, stdout=StringIO(), stderr=stderr)
+        errors = stderr.getvalue().splitlines()
+        self.assertEqual([line.split(":")[0] for line in errors], ["row 1", "row 2", "row 3", "row 4"])
+        self.assertIn("no more than 10 digits", errors[0])
+        self.assertEqual(list(Product.objects.values_list("name", "price")), [("Fine", Decimal("10.01"))])
+
+    def test_unparseable_input_is_a_command_error(self):
+        path = os.path.join(tempfile.mkdtemp(), "catalog.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write('{"name": "Shoe", "price": "10", "size": "41"}\n{not json\n')
+        with self.assertRaisesMessage(CommandError, "Could not parse"):
+            call_command("import_catalog", path, stdout=StringIO(), stderr=StringIO())
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i, sold in enumerate([5, 3, 5, 0, 3]):
+            Product.objects.create(name=f"P{i}", description="d", price=10, sold=sold)
+
+    def setUp(self):
+        catalog_cache.local_cache.clear()
+        self.addCleanup(catalog_cache.local_cache.clear)
+
+    def walk(self, url):
+        ids, pages = [], 0
+        response = self.client.get(url, {"cursor": "", "page_size": 2})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            ids += [p["id"] for p in data["results"]]
+            pages += 1
+            if not data["next"]:
+                return ids, pages
+            response = self.client.get(data["next"])
+
+    def test_keyset_pages_follow_the_ordering(self):
+        ids, pages = self.walk("/api/products/top-ordered/")
+        expected = list(Product.objects.order_by("-sold", "id").values_list("id", flat=True))
+        self.assertEqual((ids, pages), (expected, 3))
+
+        ids, _ = self.walk("/api/products/new/")
+        expected = list(Product.objects.order_by("-created_at", "id").values_list("id", flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_malformed_cursors_are_not_found(self):
+        pagination = CursorOrPageNumberPagination()
+        for position in (["x", 1], [5], ["5", None], [{"a": 1}, 1]):
+            cursor = pagination.encode_cursor(position)
+            response = self.client.get("/api/products/top-ordered/", {"cursor": cursor})
+            self.assertEqual(response.status_code, 404, position)
+        response = self.client.get("/api/products/new/", {"cursor": pagination.encode_cursor(["yesterday", 1])})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get("/api/products/top-ordered/", {"cursor": "%%%"}).status_code, 404)
+
+
+class NewProductsWindowTests(TestCase):
+    def setUp(self):
+        catalog_cache.local_cache.clear()
+        self.addCleanup(catalog_cache.local_cache.clear)
+        Product.objects.create(name="Shoe", description="d", price=10)
+        catalog_cache._flush_pending()
+
+    def test_validators_and_cache_move_with_the_clock(self):
+        first = self.client.get("/api/products/new/")
+        self.assertEqual(len(first.json()), 1)
+        # ages out of the 7-day window without any catalog change
+        Product.objects.update(created_at=timezone.now() - timedelta(days=8))
+        self.assertEqual(self.client.get("/api/products/new/", HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+
+        next_window = catalog_cache.time_bucket(3600) + 3600
+        with mock.patch.object(catalog_cache, "time_bucket", return_value=next_window):
+            response = self.client.get("/api/products/new/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        catalog_cache.local_cache.clear()
+        self.addCleanup(catalog_cache.local_cache.clear)
+        self.shoes = Category.objects.create(name="Shoes")
+        Product.objects.create(name="Leather boots", description="Brown", price=100, category=self.shoes)
+        Product.objects.create(name="Scarf", description="Goes well with boots", price=20)
+        Product.objects.create(name="Rubber boots", description="Green", price=40, category=self.shoes)
+        catalog_cache._flush_pending()
+
+    def search(self, **params):
+        data = self.client.get("/api/products/list", params).json()
+        return [p["name"] for p in (data["results"] if isinstance(data, dict) else data)]
+
+    def test_name_matches_rank_above_description_matches(self):
+        names = self.search(search="boots")
+        self.assertEqual(set(names), {"Leather boots", "Rubber boots", "Scarf"})
+        self.assertEqual(names[-1], "Scarf")
+
+    def test_prefix_and_accent_insensitive_matching(self):
+        self.assertEqual(self.search(search="leath"), ["Leather boots"])
+        self.assertEqual(self.search(search="scärf"), ["Scarf"])
+        # FTS5 syntax in the input is taken as plain words
+        self.assertEqual(self.search(search='boots* "'), self.search(search="boots"))
+        self.assertEqual(self.search(search="NEAR(boots"), [])
+
+    def test_search_combines_with_filters(self):
+        self.assertEqual(self.search(search="boots", category=self.shoes.pk, price_max=50), ["Rubber boots"])
+
+    def test_triggers_keep_the_index_in_sync(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'products_product'")
+            triggers = {row[0] for row in cursor.fetchall()}
+        self.assertLessEqual({"products_product_fts_ai", "products_product_fts_ad", "products_product_fts_au"}, triggers)
+        scarf = Product.objects.get(name="Scarf")
+        scarf.name, scarf.description = "Bandana", "Cotton"
+        scarf.save()
+        Product.objects.filter(name="Rubber boots").delete()
+        self.assertEqual(search_products(Product.objects.all(), "boots").count(), 1)
+        self.assertEqual(list(search_products(Product.objects.all(), "bandana")), [scarf])
+
+
+class VersionedCachePageTests(TestCase):
+    def setUp(self):
+        catalog_cache.local_cache.clear()
+        self.addCleanup(catalog_cache.local_cache.clear)
+        self.product = Product.objects.create(name="Shoe", description="d", price=100)
+        catalog_cache._flush_pending()
+
+    def test_saves_invalidate_the_cached_detail(self):
+        url = f"/api/products/{self.product.pk}/"
+        first = self.client.get(url)
+        self.assertEqual(first.json()["price"], "100.00")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).content, first.content)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = 90
+            self.product.save()
+        self.assertEqual(self.client.get(url).json()["price"], "90.00")
+
+    def test_views_ignoring_category_stay_on_the_catalog_namespace(self):
+        other, shoes = Category.objects.create(name="Other"), Category.objects.create(name="Shoes")
+        Product.objects.filter(pk=self.product.pk).update(category=shoes, discount_price=80)
+        catalog_cache._flush_pending()
+        url = f"/api/products/discounted/?category={other.pk}"
+        self.assertEqual([p["price"] for p in self.client.get(url).json()], ["100.00"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.refresh_from_db()
+            self.product.price = 90
+            self.product.save()
+        self.assertEqual([p["price"] for p in self.client.get(url).json()], ["90.00"])
+
+
+class HealthCheckTests(TestCase):
+    def test_cache_stats_are_for_staff_only(self):
+        self.assertEqual(self.client.get("/api/products/health/").json(), {"status": "ok"})
+        self.client.force_login(User.objects.create_user("staff", is_staff=True))
+        self.assertIn("l1_hits", self.client.get("/api/products/health/").json()["cache"])
+
+
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        catalog_cache.local_cache.clear()
+        self.addCleanup(catalog_cache.local_cache.clear)
+        self.key = f"test:two-tier:{time.time()}"
+        self.addCleanup(catalog_cache.cache.delete, self.key)
+        catalog_cache.stats.reset()
+
+    def test_l1_then_l2_then_recompute(self):
+        compute = mock.Mock(return_value="value")
+        for _ in range(2):
+            self.assertEqual(catalog_cache.get_or_set_cache(self.key, compute, 60), "value")
+        catalog_cache.local_cache.clear()
+        self.assertEqual(catalog_cache.get_or_set_cache(self.key, compute, 60), "value")
+        self.assertEqual(compute.call_count, 1)
+        stats = catalog_cache.cache_stats()
+        self.assertEqual((stats["misses"], stats["l1_hits"], stats["l2_hits"]), (1, 1, 1))
+
+    def test_expired_value_is_served_while_another_worker_refreshes(self):
+        catalog_cache.cache.set(self.key, ("old", time.time() - 1, 0.1), 60)
+        catalog_cache.cache.add(catalog_cache._lock_key(self.key), 1, 60)
+        self.addCleanup(catalog_cache.cache.delete, catalog_cache._lock_key(self.key))
+        compute = mock.Mock(return_value="new")
+        self.assertEqual(catalog_cache.get_or_set_cache(self.key, compute, 60), "old")
+        compute.assert_not_called()
+
+    def test_waiters_take_over_a_lock_released_without_a_value(self):
+        lock = catalog_cache._lock_key(self.key)
+        catalog_cache.cache.add(lock, 1, 60)
+        self.addCleanup(catalog_cache.cache.delete, lock)
+        compute = mock.Mock(return_value="value")
+        started = time.monotonic()
+        # the holder's response turns out uncacheable: it drops the lock, stores nothing
+        with mock.patch.object(catalog_cache.time, "sleep", side_effect=lambda _: catalog_cache.cache.delete(lock)):
+            self.assertEqual(catalog_cache.get_or_set_cache(self.key, compute, 60), "value")
+        self.assertLess(time.monotonic() - started, 1)
+        compute.assert_called_once()
+
+
+class ListMainImageTests(TestCase):
+    @override_settings(STORAGES={
+        **settings.STORAGES, "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    }, MEDIA_URL="/media/")
+    def test_gallery_main_image_comes_with_the_list_query(self):
+        for i in range(3):
+            product = Product.objects.create(name=f"P{i}", description="d", price=10)
+            ProductImage.objects.create(product=product, image=f"products/p{i}.jpg", is_main=True)
+        queryset = Product.objects.with_main_image().order_by("id")
+        with self.assertNumQueries(1):
+            data = ProductListSerializer(queryset, many=True).data
+        self.assertTrue(all(row["main_image_url"].endswith(f"p{i}.jpg") for i, row in enumerate(data)))
+
+
+class HomeFeedTests(TestCase):
+    def setUp(self):
+        catalog_cache.local_cache.clear()
+        self.addCleanup(catalog_cache.local_cache.clear)
+        self.shoe = Product.objects.create(name="Shoe", description="d", price=100, discount_price=80, sold=3)
+        self.boot = Product.objects.create(name="Boot", description="d", price=100, sold=1)
+        catalog_cache._flush_pending()
+
+    def feed(self):
+        return self.client.get("/api/products/home/").json()
+
+    def test_feed_is_served_from_one_snapshot(self):
+        feed = self.client.get("/api/products/home/").json()
+        self.assertEqual(set(feed), {"discounted", "new", "top_ordered", "categories"})
+        self.assertEqual([p["name"] for p in feed["discounted"]], ["Shoe"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/api/products/home/").json(), feed)
+
+    def test_saves_leave_the_rebuild_to_the_next_reader(self):
+        self.feed()
+        # stock, sold and bulk price writes: the writer doesn't render the feed
+        with mock.patch("products.home.render_home_feed") as render:
+            with self.captureOnCommitCallbacks(execute=True):
+                variant = ProductVariant.objects.create(product=self.boot, size="42", stock=5)
+                decrement_stock([(variant.pk, 5)])
+                Product.objects.filter(pk=self.boot.pk).update(discount_price=50)
+        render.assert_not_called()
+        feed = self.feed()
+        self.assertEqual([p["name"] for p in feed["top_ordered"]][:2], ["Boot", "Shoe"])
+        self.assertEqual([p["name"] for p in feed["discounted"]], ["Boot", "Shoe"])
+
+
+class DecrementStockTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name="Shoe", description="d", price=100)
+        self.small = ProductVariant.objects.create(product=self.product, size="41", stock=1)
+        self.large = ProductVariant.objects.create(product=self.product, size="42", stock=5)
+
+    def stocks(self):
+        return list(ProductVariant.objects.order_by("size").values_list("stock", flat=True))
+
+    def test_all_or_nothing_by_default(self):
+        result = decrement_stock([(self.small.pk, 1), (self.large.pk, 2), (self.small.pk, 1)])
+        self.assertEqual(result.applied, {})
+        self.assertEqual([s.variant_id for s in result.shortages], [self.small.pk])
+        self.assertEqual(self.stocks(), [1, 5])
+
+    def test_partial_applies_the_lines_that_fit(self):
+        result = decrement_stock([(self.small.pk, 2), (self.large.pk, 2), (0, 1)], allow_partial=True)
+        self.assertEqual(result.applied, {self.large.pk: 2})
+        self.assertEqual(len(result.shortages), 2)
+        self.assertEqual(self.stocks(), [1, 3])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.sold, 2)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        catalog_cache.local_cache.clear()
+        self.addCleanup(catalog_cache.local_cache.clear)
+        self.product = Product.objects.create(name="Shoe", description="d", price=100)
+        catalog_cache._flush_pending()
+
+    def test_unchanged_pages_answer_304_without_queries(self):
+        url = f"/api/products/{self.product.pk}/"
+        first = self.client.get(url)
+        self.assertIn("Last-Modified", first)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"]).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = 90
+            self.product.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 200)
@@ -0,0 +1,71 @@
+"""
+Change tracking for model instances, without re-reading the row.
+
+A model lists the attnames it cares about in `tracked_fields`; their
+values are recorded when the instance is loaded (from_db), refreshed or
+saved, and save() / signal code compares against them instead of
+SELECTing the previous values.
+"""
+
+
+class TrackedFieldsMixin:
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember()
+        return instance
+
+    def _remember(self, fields=None):
+        # deferred fields aren't in __dict__; initial_value() reads them on demand
+        loaded = self.__dict__.setdefault("_loaded_values", {})
+        for field in self.tracked_fields:
+            if (fields is None or field in fields) and field in self.__dict__:
+                loaded[field] = self.__dict__[field]
+
+    def initial_value(self, field):
+        """
+        Value of `field` when the instance was loaded or last saved; None
+        for unsaved instances. Only a field that was deferred costs a query.
+        """
+        if self._state.adding:
+            return None
+        loaded = self.__dict__.setdefault("_loaded_values", {})
+        if field not in loaded:
+            loaded[field] = (
+                type(self)._base_manager.using(self._state.db)
+                .filter(pk=self.pk).values_list(field, flat=True).first()
+            )
+        return loaded[field]
+
+    def has_changed(self, field):
+        return self._state.adding or getattr(self, field) != self.initial_value(field)
+
+    def changed_fields(self):
+        return [field for field in self.tracked_fields if self.has_changed(field)]
+
+    def full_clean(self, exclude=None, validate_unique=True, validate_constraints=True):
+        # A foreign key read from the database and left alone doesn't need
+        # its existence query; the database constraint still holds.
+        exclude = set(exclude or ())
+        if not self._state.adding:
+            exclude.update(
+                field.name for field in self._meta.concrete_fields
+                if field.is_relation and field.attname in self.tracked_fields
+                and not self.has_changed(field.attname)
+            )
+        super().full_clean(exclude=exclude, validate_unique=validate_unique, validate_constraints=validate_constraints)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None:
+            self._remember()
+        else:
+            saved = {self._meta.get_field(name).attname for name in update_fields}
+            self._remember(saved)
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        self._remember(None if fields is None else {self._meta.get_field(name).attname for name in fields})
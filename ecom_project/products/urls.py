@@ -1,4 +1,4 @@
-from django.urls import path,include
+from django.urls import path,include,re_path
 from .views import (
     ProductListView, 
     CategoryListView, 
@@ -9,7 +9,9 @@ from .views import (
     HomeDiscountedProductsView,
     HomeNewProductsView,
     HomeTopOrderedProductsView,
+    HomeFeedView,
     ProductVariantsView,
+    ProductExportView,
     health_check
 )
 
@@ -23,7 +25,9 @@ urlpatterns = [
     path('discounted-home/', HomeDiscountedProductsView.as_view(), name='discounted-home'),
     path('new-home/', HomeNewProductsView.as_view(), name='new-home'),
     path('top-ordered-home/', HomeTopOrderedProductsView.as_view(), name='top-ordered-home'),
+    path('home/', HomeFeedView.as_view(), name='home-feed'),
     path('<int:id>/variants/', ProductVariantsView.as_view(), name='product-variant-list'),
+    re_path(r'^export\.(?P<fmt>csv|ndjson)$', ProductExportView.as_view(), name='product-export'),
     path("health/", health_check)
 
 ]
@@ -3,11 +3,9 @@ from datetime import timedelta
 
 from django.utils import timezone
 from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.generics import (
     ListAPIView,
     RetrieveUpdateDestroyAPIView,
@@ -15,7 +13,6 @@ from rest_framework.generics import (
 from rest_framework.views import APIView
 
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters
 
 from .models import Product, Category
 from .serializers import (
@@ -25,95 +22,152 @@ from .serializers import (
     ProductImageSerializer,
     ProductVariantSerializer,
 )
-from products.filters import ProductFilter
+from products.filters import ProductFilter, ProductOrderingFilter, ProductSearchFilter
+from products.pagination import CursorOrPageNumberPagination
+from products.fastpath import FastProductListMixin
+from products.exports import ExportAPIView, export_products
+from products.home import (
+    get_home_feed,
+    home_discounted_products,
+    home_new_products,
+    home_top_ordered_products,
+)
+from products.cache import (
+    shared_cache,
+    versioned_cache_page,
+    conditional_catalog_page,
+    product_namespaces,
+    category_filtered_namespaces,
+    cache_stats,
+)
 
-# Pagination
-class StandardPagination(PageNumberPagination):
+# Pagination (?page=N, or ?cursor= for keyset pages on the view's cursor_ordering)
+class StandardPagination(CursorOrPageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
-# Cache TTLs
-FIVE_MINUTES = 60 * 5      # 2 hours
-HEIGHT_MINUTES = 60 * 8    # 3 hours
+# Cache TTLs. With a shared cache (Redis) entries are invalidated by
+# version bumps on every catalog change (see products/signal.py), so the
+# TTLs only bound memory use. A per-process cache only sees its own
+# process's bumps, so there the TTL is what bounds staleness.
+if shared_cache():
+    CATALOG_TTL = 60 * 60 * 2    # 2 hours
+    DETAIL_TTL = 60 * 60 * 3     # 3 hours
+else:
+    CATALOG_TTL = DETAIL_TTL = 60 * 5  # 5 minutes
 SHORT_CACHE = 60 * 3         # 3 minutes (for extras)
+# /new/ depends on the clock (last 7 days), not only on catalog changes
+NEW_PRODUCTS_WINDOW = 60 * 60  # 1 hour, like the home feed
 
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 
 def health_check(request):
-    return JsonResponse({"status": "ok"})
+    payload = {"status": "ok"}
+    # this process's cache counters are internal: staff only
+    if request.user.is_staff:
+        payload["cache"] = cache_stats()
+    return JsonResponse(payload)
+
+
 
+class OrderableListMixin:
+    """
+    Adds ?ordering= (see ProductOrderingFilter). Keyset pages (?cursor=)
+    follow the requested ordering, or default_cursor_ordering without one.
+    """
+    default_cursor_ordering = ('id',)
 
+    @property
+    def cursor_ordering(self):
+        ordering = ProductOrderingFilter().get_ordering(self.request, None, self)
+        return tuple(ordering or self.default_cursor_ordering)
 
-@method_decorator(cache_page(FIVE_MINUTES), name='dispatch')
-class ProductListView(ListAPIView):
+
+@method_decorator(conditional_catalog_page(category_filtered_namespaces), name='dispatch')
+@method_decorator(versioned_cache_page(CATALOG_TTL, category_filtered_namespaces), name='dispatch')
+class ProductListView(OrderableListMixin, FastProductListMixin, ListAPIView):
     """
     /api/products/list
-    supports ?page, ?page_size, ?search, ?category, plus any ProductFilter fields
+    supports ?page, ?page_size, ?search, ?category, ?ordering, plus any ProductFilter fields
     """
     serializer_class = ProductListSerializer
     pagination_class = StandardPagination
-    filter_backends  = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends  = [DjangoFilterBackend, ProductSearchFilter, ProductOrderingFilter]
     filterset_class  = ProductFilter
-    search_fields    = ['name', 'description']
 
     def get_queryset(self):
         return (
             Product.objects
                 .only('id', 'name', 'price', 'discount_price', 'category', 'main_image', 'created_at')
+                .with_main_image()
                 .select_related('category')
+                .order_by('id')
         )
 
-@method_decorator(cache_page(FIVE_MINUTES), name='dispatch')
-class DiscountedProductListView(ListAPIView):
+@method_decorator(conditional_catalog_page(), name='dispatch')
+@method_decorator(versioned_cache_page(CATALOG_TTL), name='dispatch')
+class DiscountedProductListView(OrderableListMixin, FastProductListMixin, ListAPIView):
     """
     /api/products/discounted
+    biggest deals first; supports ?ordering (e.g. effective_price)
     """
     serializer_class = ProductListSerializer
     pagination_class = StandardPagination
+    filter_backends  = [ProductOrderingFilter]
+    default_cursor_ordering = ('-discount_percent', '-id')
 
     def get_queryset(self):
         return (
             Product.objects
                 .only('id', 'name', 'price', 'discount_price', 'category', 'main_image', 'created_at')
-                .exclude(discount_price__isnull=True)
-                .exclude(discount_price=Decimal('0.00'))
+                .with_main_image()
+                .filter(discount_percent__gt=0)
+                .order_by(*self.default_cursor_ordering)
                 .select_related('category')
         )
 
-@method_decorator(cache_page(FIVE_MINUTES), name='dispatch')
-class NewProductListView(ListAPIView):
+@method_decorator(conditional_catalog_page(bucket=NEW_PRODUCTS_WINDOW), name='dispatch')
+@method_decorator(versioned_cache_page(CATALOG_TTL, bucket=NEW_PRODUCTS_WINDOW), name='dispatch')
+class NewProductListView(FastProductListMixin, ListAPIView):
     """
     /api/products/new-products
     """
     serializer_class = ProductListSerializer
     pagination_class = StandardPagination
+    cursor_ordering  = ('-created_at', 'id')
 
     def get_queryset(self):
         cutoff = timezone.now() - timedelta(days=7)
         return (
             Product.objects
                 .only('id', 'name', 'price', 'discount_price', 'category', 'main_image', 'created_at')
+                .with_main_image()
                 .filter(created_at__gte=cutoff)
+                .order_by('-created_at', 'id')
                 .select_related('category')
         )
 
-@method_decorator(cache_page(FIVE_MINUTES), name='dispatch')
-class TopOrderedProductsView(ListAPIView):
+@method_decorator(conditional_catalog_page(), name='dispatch')
+@method_decorator(versioned_cache_page(CATALOG_TTL), name='dispatch')
+class TopOrderedProductsView(FastProductListMixin, ListAPIView):
     """
     /api/products/top-ordered
     """
     serializer_class = ProductListSerializer
     pagination_class = StandardPagination
+    cursor_ordering  = ('-sold', 'id')
 
     def get_queryset(self):
         return (
             Product.objects
                 .only('id', 'name', 'price', 'discount_price', 'category', 'main_image', 'created_at')
-                .order_by('-sold')
+                .with_main_image()
+                .order_by('-sold', 'id')
                 .select_related('category')
         )
 
-@method_decorator(cache_page(HEIGHT_MINUTES), name='dispatch')
+@method_decorator(conditional_catalog_page(product_namespaces), name='dispatch')
+@method_decorator(versioned_cache_page(DETAIL_TTL, product_namespaces), name='dispatch')
 class ProductDetailView(RetrieveUpdateDestroyAPIView):
     """
     /api/products/<id>/
@@ -122,7 +176,8 @@ class ProductDetailView(RetrieveUpdateDestroyAPIView):
         Product.objects
                .only(
                    'id', 'name', 'description', 'price', 'discount_price', 'category',
-                   'main_image', 'created_at', 'updated_at'
+                   'main_image', 'created_at', 'updated_at', 'color', 'sold',
+                   'total_stock', 'in_stock', 'effective_price', 'discount_percent'
                )
                .select_related('category')
                .prefetch_related('images', 'variants')
@@ -130,7 +185,8 @@ class ProductDetailView(RetrieveUpdateDestroyAPIView):
     serializer_class = ProductDetailSerializer
     lookup_field     = 'id'
 
-@method_decorator(cache_page(FIVE_MINUTES), name='dispatch')
+@method_decorator(conditional_catalog_page(), name='dispatch')
+@method_decorator(versioned_cache_page(CATALOG_TTL), name='dispatch')
 class CategoryListView(ListAPIView):
     """
     /api/products/category/list
@@ -143,48 +199,38 @@ class CategoryListView(ListAPIView):
         data = self.serializer_class(qs, many=True).data
         return Response(data)
 
-@method_decorator(cache_page(FIVE_MINUTES), name='dispatch')
-class HomeDiscountedProductsView(ListAPIView):
+@method_decorator(versioned_cache_page(CATALOG_TTL), name='dispatch')
+class HomeDiscountedProductsView(FastProductListMixin, ListAPIView):
     serializer_class = ProductListSerializer
     pagination_class = None  # No pagination, just top 4
 
     def get_queryset(self):
-        return (
-            Product.objects
-                .only('id', 'name', 'price', 'discount_price', 'category', 'main_image', 'created_at')
-                .exclude(discount_price__isnull=True)
-                .exclude(discount_price=0)
-                .order_by('-discount_price')[:4]
-                .select_related('category')
-        )
+        return home_discounted_products()
 
-@method_decorator(cache_page(FIVE_MINUTES), name='dispatch')
-class HomeNewProductsView(ListAPIView):
+@method_decorator(versioned_cache_page(CATALOG_TTL), name='dispatch')
+class HomeNewProductsView(FastProductListMixin, ListAPIView):
     serializer_class = ProductListSerializer
     pagination_class = None
 
     def get_queryset(self):
-        cutoff = timezone.now() - timedelta(days=7)
-        return (
-            Product.objects
-                .only('id', 'name', 'price', 'discount_price', 'category', 'main_image', 'created_at')
-                .filter(created_at__gte=cutoff)
-                .order_by('-created_at')[:4]
-                .select_related('category')
-        )
+        return home_new_products()
 
-@method_decorator(cache_page(FIVE_MINUTES), name='dispatch')
-class HomeTopOrderedProductsView(ListAPIView):
+@method_decorator(versioned_cache_page(CATALOG_TTL), name='dispatch')
+class HomeTopOrderedProductsView(FastProductListMixin, ListAPIView):
     serializer_class = ProductListSerializer
     pagination_class = None
 
     def get_queryset(self):
-        return (
-            Product.objects
-                .only('id', 'name', 'price', 'discount_price', 'category', 'main_image', 'created_at')
-                .order_by('-sold')[:4]
-                .select_related('category')
-        )
+        return home_top_ordered_products()
+
+class HomeFeedView(APIView):
+    """
+    /api/products/home/
+    All homepage sections in one response, served from the precomputed
+    snapshot in products/home.py.
+    """
+    def get(self, request):
+        return HttpResponse(get_home_feed(), content_type='application/json')
 
 # @method_decorator(cache_page(SHORT_CACHE), name='dispatch')
 # class ProductExtrasView(APIView):
@@ -209,3 +255,11 @@ class ProductVariantsView(APIView):
             return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
         variants = ProductVariantSerializer(product.variants.all(), many=True).data
         return Response({"variants": variants})
+
+
+class ProductExportView(ExportAPIView):
+    """Staff only: every product with its variants, as CSV or NDJSON."""
+    export_filename = "products"
+
+    def get_export(self, request, fmt):
+        return export_products(fmt)